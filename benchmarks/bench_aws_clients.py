@@ -0,0 +1,40 @@
+"""Compares creating a boto3 client per read with S3Config's cached clients.
+
+No requests are sent; this measures only the client setup cost that
+S3Config used to pay on every read.
+
+Usage::
+
+    python benchmarks/bench_aws_clients.py [iterations]
+"""
+import os
+import sys
+import timeit
+
+import boto3
+
+from turf.s3config import S3Config
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "benchmark")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "benchmark")
+
+
+class BenchConfig(S3Config):
+    config_dir = "bucket"
+
+    def refresh(self):
+        pass
+
+
+def main(iterations):
+    config = BenchConfig()
+    uncached = timeit.timeit(lambda: boto3.client("s3"), number=iterations) / iterations
+    cached = timeit.timeit(lambda: config.get_aws_client("s3"), number=iterations) / iterations
+    print("boto3.client per read:     {0:10.1f} us".format(uncached * 1e6))
+    print("S3Config.get_aws_client:   {0:10.1f} us".format(cached * 1e6))
+    print("saving per read:           {0:10.1f} us".format((uncached - cached) * 1e6))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50)
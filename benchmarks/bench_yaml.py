@@ -0,0 +1,43 @@
+"""Compares PyYAML's pure Python safe loader with the libyaml loader turf uses.
+
+Usage::
+
+    python benchmarks/bench_yaml.py [size_kb] [iterations]
+"""
+import sys
+import timeit
+
+import yaml
+
+from turf import yaml_util
+
+
+def make_document(size_kb):
+    """Returns a YAML document of roughly ``size_kb`` kilobytes."""
+    section = {
+        "setting_{0}".format(index): {
+            "enabled": index % 2 == 0,
+            "hosts": ["host-{0}.example.com".format(host) for host in range(5)],
+            "timeout": index * 1.5,
+            "name": "value {0}".format(index)
+        }
+        for index in range(size_kb * 1024 // 185)
+    }
+    document = yaml.safe_dump(section, default_flow_style=False)
+    return document
+
+
+def main(size_kb, iterations):
+    document = make_document(size_kb)
+    pure = timeit.timeit(lambda: yaml.load(document, Loader=yaml.SafeLoader), number=iterations) / iterations
+    fast = timeit.timeit(lambda: yaml_util.safe_load(document), number=iterations) / iterations
+    print("document size:        {0:10.1f} KB".format(len(document) / 1024.0))
+    print("yaml.SafeLoader:      {0:10.2f} ms".format(pure * 1e3))
+    print("yaml_util.safe_load:  {0:10.2f} ms ({1})".format(
+        fast * 1e3, "libyaml" if yaml_util.HAS_LIBYAML else "pure Python fallback"))
+    print("speedup:              {0:10.1f}x".format(pure / fast))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 5)
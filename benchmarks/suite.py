@@ -0,0 +1,335 @@
+"""Runs turf's benchmark suite over its hot paths.
+
+Each benchmark is run ``--repeat`` times and the median time per
+operation is reported.  Results can be written as JSON and later used as a
+baseline, in which case the run fails if any benchmark got slower by more
+than ``--max-regression``::
+
+    python benchmarks/suite.py --output baseline.json
+    # upgrade turf or change the code
+    python benchmarks/suite.py --baseline baseline.json
+
+S3Config is benchmarked against an in-process S3/KMS stub, so no AWS
+account is needed.  ``--latency-ms`` adds a delay to every stub request.
+
+Usage::
+
+    python benchmarks/suite.py [--quick] [--filter TEXT] [--repeat N]
+                               [--latency-ms MS] [--output FILE]
+                               [--baseline FILE] [--max-regression FRACTION]
+"""
+import argparse
+import base64
+import hashlib
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import botocore.exceptions
+import yaml
+
+from turf import snapshot
+from turf.config import BaseConfig, SingleFileConfig
+from turf.s3config import S3Config
+
+SECTION_COUNTS = (10, 100)
+SIZES_KB = (1, 64)
+
+
+def make_section(size_kb):
+    """Returns a section of roughly ``size_kb`` kilobytes of YAML, and its schema."""
+    section = {}
+    schema = {}
+    for index in range(max(1, size_kb * 1024 // 60)):
+        name = "setting_{0}".format(index)
+        section[name] = {"enabled": index % 2 == 0, "host": "host-{0}.example.com".format(index)}
+        schema[name] = {"type": "dict", "schema": {
+            "enabled": {"type": "boolean"}, "host": {"type": "string"}}}
+    return section, schema
+
+
+class StubS3(object):
+    """Serves objects from memory like the parts of the S3 API turf uses."""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.objects = {}
+        self.requests = 0
+
+    def put(self, key, body):
+        self.objects[key] = (body, '"{0}"'.format(hashlib.md5(body).hexdigest()))
+
+    def _request(self):
+        self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def get_object(self, Bucket, Key, IfNoneMatch=None):  # pylint: disable=invalid-name,unused-argument
+        self._request()
+        if Key not in self.objects:
+            raise botocore.exceptions.ClientError(
+                {"Error": {"Code": "NoSuchKey"}}, "GetObject")
+        body, etag = self.objects[Key]
+        if IfNoneMatch == etag:
+            raise botocore.exceptions.ClientError(
+                {"Error": {"Code": "304"}, "ResponseMetadata": {"HTTPStatusCode": 304}}, "GetObject")
+        return {"Body": StubBody(body), "ContentLength": len(body), "ETag": etag}
+
+    def get_paginator(self, operation):  # pylint: disable=unused-argument
+        return self
+
+    def paginate(self, Bucket, Prefix):  # pylint: disable=invalid-name,unused-argument
+        self._request()
+        return [{"Contents": [{"Key": key, "ETag": etag, "Size": len(body)}
+                              for key, (body, etag) in self.objects.items()
+                              if key.startswith(Prefix)]}]
+
+
+class StubBody(object):
+
+    def __init__(self, body):
+        self.body = body
+
+    def read(self, length=None):  # pylint: disable=unused-argument
+        return self.body
+
+
+class StubKMS(object):
+    """Treats the ciphertext blob as the plaintext, after a round trip of latency."""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.requests = 0
+
+    def decrypt(self, CiphertextBlob):  # pylint: disable=invalid-name
+        self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return {"Plaintext": CiphertextBlob}
+
+
+def write_sections(config_dir, count, size_kb):
+    section, section_schema = make_section(size_kb)
+    document = yaml.safe_dump(section, default_flow_style=False)
+    schema = {}
+    for index in range(count):
+        name = "section_{0}".format(index)
+        with open(os.path.join(config_dir, name + ".yml"), "w") as section_file:
+            section_file.write(document)
+        schema[name] = section_schema
+    return schema
+
+
+def forget_sources(config):
+    """Drops the parse caches so the next refresh reads and validates every file again."""
+    config._sources.clear()  # pylint: disable=protected-access
+    config._loaded_sections.clear()  # pylint: disable=protected-access
+
+
+def bench_getitem(workdir, size_kb=1, **_):
+    schema = write_sections(workdir, 1, size_kb)
+    config = BaseConfig(config_dir=workdir, schema=schema, refresh_seconds=None)
+
+    def expired():
+        config.invalidate_section("section_0")
+        return config["section_0"]
+
+    return {
+        "getitem_cached": lambda: config["section_0"],
+        "getitem_refresh_unchanged": expired,
+    }
+
+
+def bench_refresh(workdir, count, size_kb, **_):
+    schema = write_sections(workdir, count, size_kb)
+    config = BaseConfig(config_dir=workdir, schema=schema, refresh_seconds=None)
+
+    def cold():
+        forget_sources(config)
+        config.refresh()
+
+    return {"refresh_cold": cold, "refresh_unchanged": config.refresh}
+
+
+def bench_single_file(workdir, count, size_kb, **_):
+    section, section_schema = make_section(size_kb)
+    schema = {}
+    document = {}
+    for index in range(count):
+        name = "section_{0}".format(index)
+        schema[name] = section_schema
+        document[name] = section
+    with open(os.path.join(workdir, "config.yml"), "w") as config_file:
+        yaml.safe_dump(document, config_file, default_flow_style=False)
+    config = SingleFileConfig(search_path=[workdir], config_file="config.yml", schema=schema,
+                              refresh_seconds=None)
+    return {"single_file_refresh": config.refresh}
+
+
+def bench_s3(workdir, count, size_kb, latency=0.0, **_):  # pylint: disable=unused-argument
+    section, section_schema = make_section(size_kb)
+    body = yaml.safe_dump(section, default_flow_style=False).encode("utf-8")
+    s3 = StubS3(latency)
+    kms = StubKMS(latency)
+    schema = {}
+    for index in range(count):
+        name = "section_{0}".format(index)
+        schema[name] = section_schema
+        s3.put("config/{0}.yml".format(name), body)
+        s3.put("secure/{0}.yml".format(name), base64.b64encode(body))
+
+    class StubConfig(S3Config):
+
+        def get_aws_client(self, service):
+            return kms if service == "kms" else s3
+
+    class ListedConfig(StubConfig):
+        list_sections = True
+
+    class EncryptedConfig(StubConfig):
+        encrypted = True
+
+    plain = StubConfig(config_dir="bucket/config", schema=schema, refresh_seconds=None)
+    listed = ListedConfig(config_dir="bucket/config", schema=schema, refresh_seconds=None)
+    encrypted = EncryptedConfig(config_dir="bucket/secure", schema=schema, refresh_seconds=None)
+
+    def cold():
+        forget_sources(plain)
+        plain.refresh()
+
+    def encrypted_cold():
+        forget_sources(encrypted)
+        encrypted.refresh()
+
+    return {
+        "s3_refresh_cold": cold,
+        "s3_refresh_not_modified": plain.refresh,
+        "s3_refresh_listed_unchanged": listed.refresh,
+        "s3_refresh_encrypted_cached_key": encrypted_cold,
+    }
+
+
+def benchmark_cases(quick, latency):
+    """Yields ``(factory, params)`` for every benchmark in the suite."""
+    counts = SECTION_COUNTS[:1] if quick else SECTION_COUNTS
+    sizes = SIZES_KB[:1] if quick else SIZES_KB
+    for size_kb in sizes:
+        yield bench_getitem, {"size_kb": size_kb}
+    for factory in (bench_refresh, bench_single_file, bench_s3):
+        for count in counts:
+            for size_kb in sizes:
+                params = {"count": count, "size_kb": size_kb}
+                if factory is bench_s3:
+                    params["latency"] = latency
+                yield factory, params
+
+
+def result_name(name, params):
+    return name + "".join("[{0}={1}]".format(key, params[key]) for key in sorted(params))
+
+
+def time_operation(operation, repeat, min_seconds=0.05):
+    """Returns the seconds per call of ``operation`` for each of ``repeat`` runs."""
+    operation()
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            operation()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds or loops >= 1 << 20:
+            break
+        loops *= 2
+    timings = [elapsed / loops]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(loops):
+            operation()
+        timings.append((time.perf_counter() - start) / loops)
+    return timings, loops
+
+
+def run_suite(quick=False, name_filter=None, repeat=5, latency=0.0):
+    results = {}
+    for factory, params in benchmark_cases(quick, latency):
+        workdir = tempfile.mkdtemp(prefix="turf-bench-")
+        try:
+            operations = factory(workdir, **params)
+            for name, operation in sorted(operations.items()):
+                full_name = result_name(name, params)
+                if name_filter and name_filter not in full_name:
+                    continue
+                timings, loops = time_operation(operation, repeat)
+                results[full_name] = {
+                    "seconds_per_op": statistics.median(timings),
+                    "min_seconds_per_op": min(timings),
+                    "loops": loops,
+                    "repeat": repeat,
+                    "params": params,
+                }
+                print("{0:70} {1:12.1f} us".format(full_name, results[full_name]["seconds_per_op"] * 1e6))
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        "turf_version": snapshot.turf_version(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "created": time.time(),
+        "results": results,
+    }
+
+
+def compare(current, baseline, max_regression):
+    """Prints each benchmark's change from the baseline and returns the names that regressed."""
+    regressions = []
+    print()
+    print("{0:70} {1:>12} {2:>12} {3:>8}".format("benchmark", "baseline us", "current us", "change"))
+    for name in sorted(current["results"]):
+        if name not in baseline.get("results", {}):
+            continue
+        before = baseline["results"][name]["seconds_per_op"]
+        after = current["results"][name]["seconds_per_op"]
+        change = (after - before) / before if before else 0.0
+        flag = ""
+        if change > max_regression:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print("{0:70} {1:12.1f} {2:12.1f} {3:+7.1%}{4}".format(name, before * 1e6, after * 1e6, change, flag))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks turf's hot paths")
+    parser.add_argument("--quick", action="store_true", help="Only run the smallest sizes")
+    parser.add_argument("--filter", dest="name_filter", help="Only run benchmarks whose name contains this")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per benchmark")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Latency of each S3/KMS stub request")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--baseline", help="Compare with results previously written with --output")
+    parser.add_argument("--max-regression", type=float, default=0.10,
+                        help="Fail if a benchmark is this fraction slower than the baseline")
+    args = parser.parse_args(argv)
+
+    results = run_suite(quick=args.quick, name_filter=args.name_filter, repeat=args.repeat,
+                        latency=args.latency_ms / 1000.0)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare(results, baseline, args.max_regression)
+        if regressions:
+            print("{0} benchmark(s) regressed by more than {1:.0%}".format(
+                len(regressions), args.max_regression))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
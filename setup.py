@@ -24,5 +24,6 @@ setup(
 	package_dir = {"":"src"},
 	packages = find_packages("src"),
     install_requires = ["pyyaml", "cerberus", "boto3"],
+    extras_require = {"envelope": ["cryptography"], "msgpack": ["msgpack"]},
 )
 
@@ -0,0 +1,117 @@
+"""Provides asyncio versions of the configuration managers.
+
+Example::
+
+    config = await MyConfig.create()
+    setting = (await config.aget("my_section"))["my_setting"]
+"""
+import asyncio
+import functools
+
+from .config import BaseConfig
+from .errors import SchemaNotFoundError, SectionNotFoundError
+from .s3config import S3Config
+
+
+class AsyncConfigMixin(object):
+    """Adds awaitable section access and refresh to a configuration manager.
+
+    Blocking work (file and S3 reads, KMS decrypts, and the parsing, hooks and
+    validation in :meth:`load_section`) runs on :attr:`executor`, the event
+    loop's default executor unless set, so the event loop is never blocked.
+    Concurrent requests for the same section share one reload.
+    """
+    executor = None
+
+    def __init__(self, *args, **kwargs):
+        self._pending_refreshes = {}
+        super().__init__(*args, **kwargs)
+
+    @classmethod
+    async def create(cls, *args, **kwargs):
+        """Creates and loads a config without blocking the event loop."""
+        return await cls._run_blocking(functools.partial(cls, *args, **kwargs))
+
+    @classmethod
+    async def _run_blocking(cls, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(cls.executor, functools.partial(func, *args))
+
+    async def aget(self, section_name):
+        """Returns a section, reloading it first if it has expired.
+
+        This is the awaitable equivalent of ``config[section_name]``.
+        """
+        try:
+            section_schema = self.get_schema()[section_name]
+        except KeyError:
+            raise SchemaNotFoundError(section_name) from KeyError
+
+        if self.is_section_expired(section_name):
+            await self._refresh_section_once(section_name, section_schema)
+
+        try:
+            return self.data[section_name]
+        except KeyError:
+            raise SectionNotFoundError(section_name) from KeyError
+
+    async def arefresh(self, raise_errors=True):
+        """Reloads every section concurrently.
+
+        Like :meth:`turf.config.BaseConfig.refresh`, sections that are no
+        longer in the schema are dropped and the snapshot is saved.
+
+        :param bool raise_errors: See :meth:`turf.config.BaseConfig.refresh`.
+        """
+        schema = self.get_schema()
+        await self.arefresh_sections(list(schema), raise_errors=raise_errors)
+        await self._run_blocking(self.finish_refresh, schema)
+
+    async def arefresh_expired(self):
+        """Reloads every expired section concurrently."""
+        await self.arefresh_sections([section_name for section_name in self.get_schema()
+                                      if self.is_section_expired(section_name)])
+
+    async def arefresh_sections(self, section_names, raise_errors=True):
+        """Reloads the named sections concurrently with :func:`asyncio.gather`.
+
+        Every section is attempted; if any fail, the error from the first
+        failing section in ``section_names`` is raised, unless
+        ``raise_errors`` is False and the section kept its last good value.
+        """
+        schema = self.get_schema()
+        results = await asyncio.gather(*[
+            self._refresh_section_once(section_name, schema[section_name], raise_errors)
+            for section_name in section_names
+        ], return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+
+    async def _refresh_section_once(self, section_name, section_schema, raise_errors=False):
+        pending = self._pending_refreshes
+        refresh = pending.get(section_name)
+        if refresh is None:
+            refresh = asyncio.ensure_future(
+                self._run_blocking(self.refresh_section, section_name, section_schema))
+            pending[section_name] = refresh
+            refresh.add_done_callback(lambda _: pending.pop(section_name, None))
+        await asyncio.shield(refresh)
+        # The reload may have been started by an access, which keeps the last
+        # good value quietly; refresh_errors holds its error until it succeeds
+        if raise_errors and section_name in self.refresh_errors:
+            raise self.refresh_errors[section_name]
+
+
+class AsyncConfig(AsyncConfigMixin, BaseConfig):
+    """A :class:`turf.config.BaseConfig` with an asyncio interface."""
+
+
+class AsyncS3Config(AsyncConfigMixin, S3Config):
+    """A :class:`turf.s3config.S3Config` with an asyncio interface."""
+
+    async def arefresh_sections(self, section_names, raise_errors=True):
+        section_names = list(section_names)
+        if self.uses_listing() and section_names:
+            await self._run_blocking(self.list_before_refresh)
+        await super().arefresh_sections(section_names, raise_errors=raise_errors)
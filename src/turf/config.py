@@ -1,12 +1,109 @@
-from collections import UserDict
+from collections import OrderedDict, UserDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+import copy
+import hashlib
+import logging
 import os
+import threading
 import time
+from types import MappingProxyType
 import warnings
+import weakref
 
-import yaml
 import cerberus
 
+from . import formats, instrumentation, snapshot, yaml_util
+from .stats import SectionStats, to_prometheus
 from .errors import SectionNotFoundError, SchemaNotFoundError, ValidationError
+from .frozen import freeze
+from .policies import EXPIRED, Never, TTL
+from .resilience import CircuitBreaker, backoff_delay, jitter_deadline
+from .watch import create_watcher
+
+logger = logging.getLogger(__name__)
+
+_configs = weakref.WeakValueDictionary()
+
+
+def _reset_configs_after_fork():
+    for config in list(_configs.values()):
+        config._reset_after_fork()  # pylint: disable=protected-access
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_configs_after_fork)
+
+
+def fingerprint(value):
+    """Returns a stable digest of a schema or settings dictionary.
+
+    Used to detect when a section's schema or defaults have changed
+    so that cached work can be discarded.
+    """
+    return hashlib.sha1(repr(value).encode("utf-8")).hexdigest()
+
+
+def _mtime_is_settled(mtime_ns):
+    """Returns True if a directory's mtime is old enough to reflect every change to it.
+
+    Directory mtimes are coarse, so one from within the last second may be
+    shared by a later change.
+    """
+    return time.time() - mtime_ns / 1e9 > 1
+
+
+def identical_settings(first, second):
+    """Returns True if two parsed settings are equal and of the same types throughout.
+
+    Unlike ``==``, ``1``, ``1.0`` and ``True`` are considered different, so
+    editing one into another counts as a change.
+    """
+    if type(first) is not type(second):
+        return False
+    if isinstance(first, dict):
+        return first.keys() == second.keys() and all(
+            identical_settings(value, second[key]) for key, value in first.items())
+    if isinstance(first, (list, tuple)):
+        return len(first) == len(second) and all(
+            identical_settings(item, other) for item, other in zip(first, second))
+    return first == second
+
+
+class StageTimer(object):
+    """Records how long each stage of loading a section took, in seconds.
+
+    :attr:`started` is the wall clock time the timer was created and
+    :attr:`starts` holds each stage's start as seconds after that.
+    """
+
+    def __init__(self):
+        self.timings = OrderedDict()
+        self.starts = OrderedDict()
+        self.started = time.time()
+        self._origin = self._last = time.perf_counter()
+
+    def lap(self, stage):
+        """Records the time since the previous lap as the duration of ``stage``."""
+        now = time.perf_counter()
+        self.timings[stage] = now - self._last
+        self.starts[stage] = self._last - self._origin
+        self._last = now
+
+    def merge(self, other):
+        """Adds the stages of a timer that ran during this one, such as the parts of a read."""
+        offset = other._origin - self._origin  # pylint: disable=protected-access
+        for stage, seconds in other.timings.items():
+            self.timings[stage] = seconds
+            self.starts[stage] = other.starts[stage] + offset
+
+    def elapsed(self):
+        """Returns the seconds from creating the timer to its last lap."""
+        return self._last - self._origin
+
+    def reset(self):
+        """Starts timing the next stage without recording a skipped one."""
+        self._last = time.perf_counter()
+
 
 class BaseConfig(UserDict):
     """Provides a base class for a configuration manager.
@@ -27,15 +124,72 @@ class BaseConfig(UserDict):
     mergehooks = {}
     posthooks = {}
 
+    refresh_policies = {}
+
     safe_load = True
 
     config_dir = None
+    section_extensions = (".yml",)
+
+    immutable = False
+
+    snapshot_path = None
+
+    lazy = False
+
+    watch = False
+    watch_poll_seconds = 1.0
+    watch_debounce_seconds = 0.1
+
+    stale_while_revalidate = False
+    max_staleness_seconds = 300.0
+    background_refresh_workers = 2
+
+    refresh_jitter = 0.1
+    serve_stale_on_error = True
+    retry_backoff_seconds = 1.0
+    max_retry_backoff_seconds = 300.0
+    circuit_failure_threshold = 5
+    circuit_reset_seconds = 30.0
+
+    timing_sinks = ()
 
     def __init__(self, *args, values=None, schema=None, defaults=None,
-                 config_dir=None, refresh_seconds=60, **kwargs):
+                 config_dir=None, refresh_seconds=60, watch=None,
+                 stale_while_revalidate=None, immutable=None, snapshot_path=None,
+                 lazy=None, timing_sinks=None, refresh_policies=None, **kwargs):
         """
         :param str refresh_seconds: The age of a section in seconds before
             it will be refreshed from the configuration upon access.
+            If None, sections are only refreshed when invalidated.
+            Sections with a policy in :attr:`refresh_policies` ignore this.
+
+        :param dict refresh_policies: Maps section names to refresh policies.
+            See :mod:`turf.policies` and :meth:`get_refresh_policies`.
+
+        :param bool watch: Watch the configuration for changes and invalidate
+            sections whose files change.  See :meth:`start_watching`.
+
+        :param bool stale_while_revalidate: Serve expired sections immediately
+            while they are reloaded in the background, for up to
+            :attr:`max_staleness_seconds` past their last refresh (300 by
+            default; None serves them for as long as reloads keep failing).
+
+        :param bool immutable: Return sections as read-only mappings (see
+            :func:`turf.frozen.freeze`) so they can be shared between
+            threads without copying.
+
+        :param str snapshot_path: A local file used to persist loaded
+            sections between processes.  See :meth:`restore_snapshot`.
+            SingleFileConfig and encrypted S3Configs ignore it with a warning.
+
+        :param bool lazy: Do not load anything when the config is created;
+            each section is loaded the first time it is accessed.  Use
+            :meth:`preload` to load sections up front.  Note that ``len()``,
+            ``in`` and iteration only see sections that have been loaded.
+
+        :param list timing_sinks: Sinks or callables that receive how long
+            each stage of loading a section took.  See :mod:`turf.instrumentation`.
         """
         if values is None:
             values = {}
@@ -47,10 +201,54 @@ class BaseConfig(UserDict):
             self.defaults.update(defaults)
         if config_dir is not None:
             self.config_dir = config_dir
+        if watch is not None:
+            self.watch = watch
+        if stale_while_revalidate is not None:
+            self.stale_while_revalidate = stale_while_revalidate
+        if immutable is not None:
+            self.immutable = immutable
+        if snapshot_path is not None:
+            self.snapshot_path = snapshot_path
+        if lazy is not None:
+            self.lazy = lazy
+        if refresh_policies is not None:
+            self.refresh_policies = refresh_policies
+        if timing_sinks is None:
+            timing_sinks = self.timing_sinks
+        self.timing_sinks = tuple(instrumentation.as_timing_sink(sink) for sink in timing_sinks)
         self.section = self.get_section
         self.refresh_seconds = refresh_seconds
         self.last_refresh_sections = {}
-        self.refresh()
+        self._refresh_deadlines = {}
+        self._stale_deadlines = {}
+        self._circuit_breakers = {}
+        self._validator_cache = {}
+        self.validator_cache_hits = 0
+        self.validator_cache_misses = 0
+        self._validated_defaults = {}
+        self._loaded_sections = {}
+        self._sources = {}
+        self.section_timings = {}
+        self._read_timers = {}
+        self._section_stats = {}
+        self._watcher = None
+        self._background_executor = None
+        self._background_refreshes = set()
+        self.refresh_errors = {}
+        self._lock = threading.Lock()
+        self._section_locks = {}
+        self._pid = os.getpid()
+        _configs[id(self)] = self
+        self._frozen_sections = {}
+        self._snapshot_state = None
+        self._snapshot_restored = False
+        self._snapshot_warned = False
+        self._config_dir_listing = None
+        if not self.lazy:
+            self._restore_snapshot_once()
+            self.refresh()
+        if self.watch:
+            self.start_watching()
 
     @classmethod
     def section(cls, section_name, refresh=False):
@@ -74,15 +272,15 @@ class BaseConfig(UserDict):
             section_schema = self.get_schema()[key]
         except KeyError:
             raise SchemaNotFoundError(key) from KeyError
-        last_refresh = self.last_refresh_sections.get(key)
-        do_refresh=False
-        if not last_refresh:
-            do_refresh=True
-        elif int(time.time()) - last_refresh > self.refresh_seconds:
-            do_refresh=True
 
-        if do_refresh:
-            self.refresh_section(key, section_schema)
+        if time.monotonic() >= self._refresh_deadlines.get(key, EXPIRED):
+            if key in self.data and self.serves_stale(key) and not self.is_section_too_stale(key):
+                self.get_section_stats(key).stale_hits += 1
+                self.refresh_section_in_background(key, section_schema)
+            else:
+                self.refresh_section_once(key, section_schema)
+        else:
+            self.get_section_stats(key).cache_hits += 1
 
         try:
             return self.data[key]
@@ -96,6 +294,32 @@ class BaseConfig(UserDict):
 
         return cerberus.Validator(schema)
 
+    def get_section_validator(self, section_name, section_schema, schema_hash=None):
+        """Returns a cached cerberus validator for a section.
+
+        Validators are built with :meth:`get_validator` the first time a
+        section is loaded and reused until the section's schema changes.
+        :attr:`validator_cache_hits` and :attr:`validator_cache_misses`
+        count how often the cache was used.
+
+        :param str schema_hash: The :func:`fingerprint` of ``section_schema``,
+            if the caller has already computed it.
+        """
+        if schema_hash is None:
+            schema_hash = fingerprint(section_schema)
+        cached = self._validator_cache.get(section_name)
+        if cached is not None and cached[0] == schema_hash:
+            self.validator_cache_hits += 1
+            return cached[1]
+        self.validator_cache_misses += 1
+        validator = self.get_validator(section_schema)
+        self._validator_cache[section_name] = (schema_hash, validator)
+        return validator
+
+    def clear_validator_cache(self):
+        """Discards all cached validators."""
+        self._validator_cache = {}
+
     def get_schema(self):
         """Returns a dictionary of cerberus schema describing the structure of your config.
 
@@ -152,22 +376,448 @@ class BaseConfig(UserDict):
         else:
             return self.config_dir
 
-    def refresh(self):
+    def refresh(self, raise_errors=True):
         """Reloads all values from the files on disk, verifying the data against the schema.
 
         This will be called on creating of a Config.
+
+        :param bool raise_errors: Raise the first error, even for sections
+            whose last good value is kept (see :meth:`section_failed`).
         """
-        self.data = {}
-        for section_name, section_schema in self.get_schema().items():
-            self.refresh_section(section_name, section_schema)
+        schema = self.get_schema()
+        self.refresh_sections(schema, raise_errors=raise_errors)
+        self.finish_refresh(schema)
 
+    def finish_refresh(self, schema):
+        """Drops sections that are no longer in the schema and saves the snapshot after a full refresh."""
+        with self._lock:
+            self.data = {section_name: self.data[section_name] for section_name in schema
+                         if section_name in self.data}
+        if self.get_snapshot_path():
+            self.save_snapshot()
 
-    def refresh_section(self, section_name, section_schema):
-        defaults = self.get_defaults()
-        section_defaults = defaults.get(section_name, {})
-        self.data[section_name] = self.load_section(section_name, section_defaults, section_schema)
+    def get_snapshot_path(self):
+        """Returns the snapshot file to use, or None to not use one.
+
+        Without overriding, this will return :attr:`snapshot_path`.
+        """
+        return self.snapshot_path
+
+    def ignore_snapshot_path(self, reason):
+        """Returns None for :meth:`get_snapshot_path`, warning once that :attr:`snapshot_path` is ignored."""
+        if self.snapshot_path and not self._snapshot_warned:
+            self._snapshot_warned = True
+            logger.warning("Ignoring snapshot_path %s: %s", self.snapshot_path, reason)
+        return None
+
+    def get_snapshot_key(self):
+        """Returns the values a snapshot must have been saved with to be restored."""
+        config_class = type(self)
+        return (snapshot.FORMAT_VERSION, snapshot.turf_version(),
+                config_class.__module__, config_class.__qualname__, self.get_config_dir())
+
+    def _restore_snapshot_once(self):
+        if not self._snapshot_restored and self.get_snapshot_path():
+            self._snapshot_restored = True
+            self.restore_snapshot()
+
+    def restore_snapshot(self):
+        """Seeds the parse and validation caches from :attr:`snapshot_path`.
+
+        Nothing is published by this; the following :meth:`refresh` still
+        checks every source, but sections whose source, schema and defaults
+        are unchanged are not parsed or validated again.  A file whose stat
+        changed but whose content digest matches is also treated as unchanged.
+
+        :rtype: bool, True if a snapshot was restored.
+        """
+        snapshot_path = self.get_snapshot_path()
+        if not snapshot_path:
+            return False
+        stored = snapshot.load_snapshot(snapshot_path)
+        if stored is None or stored.get("key") != self.get_snapshot_key():
+            return False
+        sources = {}
+        for section_name, source in stored["sources"].items():
+            digest = stored["digests"].get(section_name)
+            if digest is not None and self.source_digest_matches(section_name, digest):
+                source = (self.get_section_signature(section_name), source[1])
+            sources[section_name] = source
+        self._sources.update(sources)
+        self._loaded_sections.update(stored["loaded"])
+        self._validated_defaults.update(stored["validated_defaults"])
+        self._snapshot_state = self._get_snapshot_state()
+        return True
+
+    def save_snapshot(self):
+        """Writes the parse and validation caches to :attr:`snapshot_path` if they changed."""
+        snapshot_path = self.get_snapshot_path()
+        if not snapshot_path:
+            return
+        state = self._get_snapshot_state()
+        if state == self._snapshot_state:
+            return
+        digests = {}
+        for section_name, source in self._sources.items():
+            digests[section_name] = self.get_source_digest(section_name, source[0])
+        try:
+            snapshot.write_snapshot(snapshot_path, {
+                "key": self.get_snapshot_key(),
+                "sources": dict(self._sources),
+                "loaded": dict(self._loaded_sections),
+                "validated_defaults": dict(self._validated_defaults),
+                "digests": digests
+            })
+        except OSError:
+            logger.warning("Unable to write config snapshot %s", snapshot_path, exc_info=True)
+            return
+        self._snapshot_state = state
+
+    def _get_snapshot_state(self):
+        return ({section_name: source[0] for section_name, source in self._sources.items()},
+                {section_name: loaded[0] for section_name, loaded in self._loaded_sections.items()})
+
+    def get_source_digest(self, section_name, signature):
+        """Returns a content digest of a section's file, or None if it has changed since it was read."""
+        if signature is None:
+            return None
+        try:
+            digest = snapshot.file_digest(self.get_file_path_for_section(section_name))
+        except OSError:
+            return None
+        if self.get_section_signature(section_name) != signature:
+            return None
+        return digest
+
+    def source_digest_matches(self, section_name, digest):
+        """Returns True if a section's file currently has the given content digest."""
+        try:
+            return snapshot.file_digest(self.get_file_path_for_section(section_name)) == digest
+        except OSError:
+            return False
+
+    def snapshot(self):
+        """Returns a read-only view of the currently loaded sections.
+
+        Refreshes never modify a published dictionary; they build a new one
+        and swap it in, so the view stays consistent while it is used.
+        """
+        return MappingProxyType(self.data)
+
+    def publish_section(self, section_name, section_config):
+        """Replaces a section, swapping in a new copy of :attr:`data`.
+
+        If :attr:`immutable` is set, the section is frozen first.
+        """
+        if self.immutable:
+            section_config = self._freeze_section(section_name, section_config)
+        with self._lock:
+            data = dict(self.data)
+            data[section_name] = section_config
+            self.data = data
+
+    def _freeze_section(self, section_name, section_config):
+        frozen = self._frozen_sections.get(section_name)
+        if frozen is None or frozen[0] is not section_config:
+            frozen = self._frozen_sections[section_name] = (section_config, freeze(section_config))
+        return frozen[1]
+
+    def preload(self, sections=None):
+        """Loads sections now rather than on first access, raising any errors.
+
+        Intended for lazy configs in services that should fail at startup
+        if their configuration is invalid.
+
+        :param sections: The names of the sections to load, defaulting to
+            every section in the schema.
+        """
+        schema = self.get_schema()
+        if sections is None:
+            sections = list(schema)
+        for section_name in sections:
+            if section_name not in schema:
+                raise SchemaNotFoundError(section_name)
+        self.refresh_sections(sections)
+        if self.get_snapshot_path():
+            self.save_snapshot()
+
+    def refresh_sections(self, section_names, raise_errors=True):
+        """Reloads the named sections.
+
+        :param bool raise_errors: See :meth:`refresh_section`.
+        """
+        schema = self.get_schema()
+        for section_name in section_names:
+            self.refresh_section(section_name, schema[section_name], raise_errors=raise_errors)
+
+    def refresh_expired(self):
+        """Reloads every section that would be refreshed on its next access."""
+        self.refresh_sections([section_name for section_name in self.get_schema()
+                               if self.is_section_expired(section_name)])
+
+    def is_section_expired(self, section_name):
+        """Returns True if a section has not been loaded or its refresh policy says it has expired."""
+        return time.monotonic() >= self._refresh_deadlines.get(section_name, EXPIRED)
+
+    def is_section_too_stale(self, section_name):
+        """Returns True if a section is too old to be served while it is reloaded.
+
+        See :attr:`max_staleness_seconds` and :class:`turf.policies.MaxStaleness`.
+        """
+        return time.monotonic() >= self._stale_deadlines.get(section_name, EXPIRED)
+
+    def serves_stale(self, section_name):
+        """Returns True if a section's expired value is served while it is reloaded in the background."""
+        return self.stale_while_revalidate or self.get_refresh_policy(section_name).stale_while_revalidate
+
+    def get_refresh_policies(self):
+        """Returns a dictionary mapping section names to refresh policies.
+
+        Without overriding, this will return :attr:`refresh_policies`.
+
+        Return structure is like::
+
+            {
+                'section_name':<turf.policies.RefreshPolicy>
+            }
+        """
+        return self.refresh_policies
+
+    def get_refresh_policy(self, section_name):
+        """Returns a section's refresh policy, defaulting to one based on :attr:`refresh_seconds`."""
+        policy = self.get_refresh_policies().get(section_name)
+        if policy is not None:
+            return policy
+        if self.refresh_seconds is None:
+            return Never()
+        return TTL(self.refresh_seconds)
+
+    def schedule_section(self, section_name, loaded_at=None):
+        """Computes when a freshly loaded section expires, using its refresh policy.
+
+        The refresh deadline is brought forward by a random fraction of up
+        to :attr:`refresh_jitter` of its interval, so that processes started
+        together do not all reload at the same moment.
+
+        :param float loaded_at: The :func:`time.monotonic` time the section was loaded.
+        """
+        if loaded_at is None:
+            loaded_at = time.monotonic()
+        policy = self.get_refresh_policy(section_name)
+        self._stale_deadlines[section_name] = policy.get_stale_deadline(self, loaded_at)
+        self._refresh_deadlines[section_name] = jitter_deadline(
+            loaded_at, policy.get_refresh_deadline(self, loaded_at), self.refresh_jitter)
         self.last_refresh_sections[section_name] = int(time.time())
 
+    def refresh_section_in_background(self, section_name, section_schema):
+        """Reloads a section on a background thread unless a reload is already running.
+
+        If the reload fails, the current value is kept and the error is
+        handled as described in :meth:`section_failed`.
+        """
+        self._check_fork()
+        with self._lock:
+            if section_name in self._background_refreshes:
+                return
+            if self._background_executor is None:
+                self._background_executor = ThreadPoolExecutor(
+                    max_workers=self.background_refresh_workers)
+            self._background_refreshes.add(section_name)
+            executor = self._background_executor
+        executor.submit(self._refresh_section_in_background, section_name, section_schema)
+
+    def _check_fork(self):
+        # Only needed where os.register_at_fork is unavailable
+        if os.getpid() != self._pid:
+            self._reset_after_fork()
+
+    def _reset_after_fork(self):
+        """Replaces the locks, background reloads and circuit breakers inherited over fork().
+
+        The parent's threads do not exist in the child, so locks they held
+        would never be released and reloads they were running never finish.
+        The old locks are not acquired, since they may be held.
+        """
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._section_locks = {}
+        self._background_executor = None
+        self._background_refreshes = set()
+        self._circuit_breakers = {}
+
+    def _refresh_section_in_background(self, section_name, section_schema):
+        try:
+            self.refresh_section(section_name, section_schema)
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Error refreshing section '%s' in the background", section_name)
+        finally:
+            self._background_refreshes.discard(section_name)
+
+    def invalidate_section(self, section_name):
+        """Marks a section as stale so it is reloaded the next time it is accessed."""
+        self._refresh_deadlines.pop(section_name, None)
+        self.last_refresh_sections.pop(section_name, None)
+
+    def get_watch_directories(self):
+        """Returns the directories watched by :meth:`start_watching`."""
+        return [self.get_config_dir()]
+
+    def start_watching(self):
+        """Starts a background watcher that invalidates sections as their files change.
+
+        inotify is used where available, otherwise the directories are polled
+        every :attr:`watch_poll_seconds`.  Bursts of changes are coalesced for
+        :attr:`watch_debounce_seconds` before sections are invalidated.
+        Combine with ``refresh_seconds=None`` to stop polling files on access.
+        """
+        if self._watcher is not None:
+            return
+        self._watcher = create_watcher(
+            self.get_watch_directories(), self.files_changed,
+            debounce_seconds=self.watch_debounce_seconds,
+            poll_seconds=self.watch_poll_seconds)
+        self._watcher.start()
+
+    def stop_watching(self):
+        if self._watcher is not None:
+            self._watcher.stop()
+            self._watcher = None
+
+    def files_changed(self, paths):
+        """Called by the watcher with the set of paths that changed.
+
+        :param paths: A set of file paths, or None if any file may have changed.
+        """
+        if paths is not None:
+            changed = set()
+            for path in paths:
+                section_name, extension = os.path.splitext(os.path.basename(path))
+                if extension in self.section_extensions:
+                    changed.add(section_name)
+        for section_name in self.get_schema():
+            if paths is None or section_name in changed:
+                self.invalidate_section(section_name)
+
+    def get_section_lock(self, section_name):
+        """Returns the lock held while a section is being reloaded."""
+        self._check_fork()
+        lock = self._section_locks.get(section_name)
+        if lock is None:
+            with self._lock:
+                lock = self._section_locks.setdefault(section_name, threading.RLock())
+        return lock
+
+    def refresh_section_once(self, section_name, section_schema):
+        """Reloads an expired section, ensuring only one thread reloads it at a time.
+
+        If another thread is already reloading the section, the current value
+        is returned immediately if there is one and it is within
+        :attr:`max_staleness_seconds`.  Otherwise this waits for the other
+        thread and only reloads if the section is still expired afterwards.
+        """
+        lock = self.get_section_lock(section_name)
+        if not lock.acquire(blocking=False):
+            if section_name in self.data and not self.is_section_too_stale(section_name):
+                return
+            lock.acquire()
+        try:
+            if self.is_section_expired(section_name):
+                self.refresh_section(section_name, section_schema)
+        finally:
+            lock.release()
+
+    def refresh_section(self, section_name, section_schema, raise_errors=False):
+        """Reloads a section and publishes it.
+
+        :param bool raise_errors: Raise errors even if the last good value is
+            kept (see :meth:`section_failed`).  Explicit reloads such as
+            :meth:`refresh` and :meth:`preload` raise; reloads triggered by
+            accessing a section or running in the background do not.
+        """
+        self._restore_snapshot_once()
+        with self.get_section_lock(section_name):
+            defaults = self.get_defaults()
+            section_defaults = defaults.get(section_name, {})
+            try:
+                section_config = self.load_section(section_name, section_defaults, section_schema)
+            except Exception as load_error:
+                if self.section_failed(section_name, load_error) and not raise_errors:
+                    return
+                raise
+            self.publish_section(section_name, section_config)
+            self.schedule_section(section_name)
+            self.refresh_errors.pop(section_name, None)
+
+    def section_failed(self, section_name, error):
+        """Handles a failed reload of a section.
+
+        The error is kept in :attr:`refresh_errors` and the section's stats.
+        If :attr:`serve_stale_on_error` is True and the section has a value,
+        the value is kept and marked as degraded (see :meth:`is_section_degraded`).
+        The next reload is then delayed by an exponential backoff, starting
+        at :attr:`retry_backoff_seconds` and growing to at most
+        :attr:`max_retry_backoff_seconds`.
+
+        Returns True if the previous value is kept, or False if the error
+        must be raised.  Explicit reloads raise the error either way.
+        """
+        section_stats = self.get_section_stats(section_name)
+        section_stats.record_error(error)
+        self.refresh_errors[section_name] = error
+        if not self.serve_stale_on_error or section_name not in self.data:
+            return False
+        section_stats.degraded = True
+        delay = backoff_delay(section_stats.consecutive_errors, self.retry_backoff_seconds,
+                              self.max_retry_backoff_seconds)
+        self._refresh_deadlines[section_name] = time.monotonic() + delay
+        logger.warning("Keeping the last good value of section '%s', retrying in %.1f seconds: %r",
+                       section_name, delay, error)
+        return True
+
+    def is_section_degraded(self, section_name):
+        """Returns True if a section's last reload failed and its previous value is being served."""
+        section_stats = self._section_stats.get(section_name)
+        return section_stats is not None and section_stats.degraded
+
+    def get_degraded_sections(self):
+        return set(section_name for section_name, section_stats in list(self._section_stats.items())
+                   if section_stats.degraded)
+
+    def get_circuit_breaker(self, backend):
+        """Returns the :class:`turf.resilience.CircuitBreaker` for a backend, such as "s3" or "kms"."""
+        breaker = self._circuit_breakers.get(backend)
+        if breaker is None:
+            with self._lock:
+                breaker = self._circuit_breakers.setdefault(backend, CircuitBreaker(
+                    backend, failure_threshold=self.circuit_failure_threshold,
+                    reset_seconds=self.circuit_reset_seconds))
+        return breaker
+
+    def call_backend(self, backend, operation, *args, **kwargs):
+        """Calls ``operation`` through the backend's circuit breaker.
+
+        Exceptions for which :meth:`is_backend_failure` is True count
+        towards opening the circuit.  While it is open,
+        :class:`turf.errors.CircuitOpenError` is raised without calling
+        ``operation``.
+        """
+        breaker = self.get_circuit_breaker(backend)
+        breaker.before_call()
+        try:
+            result = operation(*args, **kwargs)
+        except Exception as error:
+            if self.is_backend_failure(error):
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            raise
+        breaker.record_success()
+        return result
+
+    def is_backend_failure(self, error):
+        """Returns True if an error means a backend is unavailable, rather than that it answered."""
+        return True
+
     def get_prehooks(self):
         """Returns a dictionary mapping section names to pre-hooks.
 
@@ -275,78 +925,275 @@ class BaseConfig(UserDict):
 
         Calls all hooks and implements default merge behavior if none is defined.
 
+        Loading runs as a series of stages.  Defaults are only validated
+        the first time they are seen for the current schema, and the
+        intermediate validations are only repeated after a hook has run.
+        How long each stage took is recorded in :attr:`section_timings`.
+
+        For sections without hooks, if :meth:`read_section_from_file` returns
+        the same object it returned last time (meaning its source has not
+        changed) the previously validated section is reused.  The cached
+        section is never handed out: callers get a deep copy, or with
+        :attr:`immutable` the cached object itself, which is frozen before it
+        is published.  Sections with hooks are built from copies of the
+        parsed file and defaults, so neither is shared with the result.
+
         :rtype: dict of settings for this section.
         """
         prehooks = self.get_prehooks()
         mergehooks = self.get_mergehooks()
         posthooks = self.get_posthooks()
 
-        validator = self.get_validator(section_schema)
+        schema_hash = fingerprint(section_schema)
+        validator = self.get_section_validator(section_name, section_schema, schema_hash)
+        timer = StageTimer()
 
-        if not validator.validate(section_defaults, update=True):
-            self.raise_validation_error(section_name, validator.errors)
+        defaults_key = (schema_hash, fingerprint(section_defaults))
+        if self._validated_defaults.get(section_name) != defaults_key:
+            if not validator.validate(section_defaults, update=True):
+                self.raise_validation_error(section_name, validator.errors)
+            self._validated_defaults[section_name] = defaults_key
+            timer.lap("validate_defaults")
+
+        timer.reset()
+        config_from_file = self.read_section_from_file(section_name)
+        timer.lap("read")
+        read_timer = self._read_timers.pop(section_name, None)
+        if read_timer is not None:
+            timer.merge(read_timer)
+
+        hooked = section_name in prehooks or section_name in mergehooks or section_name in posthooks
+        if not hooked:
+            loaded = self._loaded_sections.get(section_name)
+            if loaded is not None and loaded[0] == defaults_key and loaded[1] is config_from_file:
+                # The reader handed back its cached parse, so the source is unchanged
+                self.record_timings(section_name, timer, unchanged=True)
+                return self._copy_cached_section(loaded[2])
+        else:
+            # Hooks and the sections they produce must not share objects with
+            # the cached parse or the configured defaults
+            section_defaults = copy.deepcopy(section_defaults)
+            config_from_file = copy.deepcopy(config_from_file)
 
         if section_name in prehooks:
+            timer.reset()
             section_defaults = prehooks[section_name](section_name, section_defaults)
-
-        if not validator.validate(section_defaults, update=True):
-            self.raise_validation_error(section_name, validator.errors)
-
-        config_from_file = self.read_section_from_file(section_name)
+            timer.lap("prehook")
+            if not validator.validate(section_defaults, update=True):
+                self.raise_validation_error(section_name, validator.errors)
+            timer.lap("validate_prehook")
 
         if section_name in mergehooks:
             section_config = mergehooks[section_name](section_name, section_defaults, config_from_file)
         else:
-            section_config = dict(list(section_defaults.items()) + list(config_from_file.items()))
-
-        if not validator.validate(section_config, update=True):
-            self.raise_validation_error(section_name, validator.errors)
+            section_config = dict(section_defaults)
+            section_config.update(config_from_file)
+        timer.lap("merge")
 
         if section_name in posthooks:
+            if not validator.validate(section_config, update=True):
+                self.raise_validation_error(section_name, validator.errors)
+            timer.lap("validate")
             section_config = posthooks[section_name](section_name, section_config)
+            timer.lap("posthook")
+            if not validator.validate(section_config):
+                self.raise_validation_error(section_name, validator.errors)
+            timer.lap("validate_final")
+        else:
+            if not validator.validate(section_config):
+                self.raise_validation_error(section_name, validator.errors)
+            timer.lap("validate")
+
+        self.record_timings(section_name, timer)
+        if not hooked:
+            self._loaded_sections[section_name] = (defaults_key, config_from_file, section_config)
+            return self._copy_cached_section(section_config)
+        return section_config
 
-        if not validator.validate(section_config):
-            self.raise_validation_error(section_name, validator.errors)
+    def _copy_cached_section(self, section_config):
+        if self.immutable:
+            return section_config
+        return copy.deepcopy(section_config)
 
-        return section_config
+    def add_timing_sink(self, sink):
+        """Registers a sink or callable to receive stage timings.  See :mod:`turf.instrumentation`."""
+        with self._lock:
+            self.timing_sinks = self.timing_sinks + (instrumentation.as_timing_sink(sink),)
+
+    def record_timings(self, section_name, timer, unchanged=False):
+        """Stores a load's stage timings in :attr:`section_timings` and emits them to the timing sinks.
+
+        :param bool unchanged: The load reused the previous value because
+            the section's source had not changed.
+        """
+        self.section_timings[section_name] = timer.timings
+        self.get_section_stats(section_name).record_load(timer, unchanged=unchanged)
+        if self.timing_sinks:
+            instrumentation.emit(self.timing_sinks, section_name, timer)
+
+    def record_read_timer(self, section_name, timer, bytes_read=0):
+        """Lets :meth:`read_section_from_file` report the stages of a read.
+
+        They are added to the timings of the load in progress, after ``read``.
+
+        :param int bytes_read: How much was read from the section's source.
+        """
+        self._read_timers[section_name] = timer
+        if bytes_read:
+            self.get_section_stats(section_name).bytes_read += bytes_read
+
+    def get_section_stats(self, section_name):
+        """Returns the :class:`turf.stats.SectionStats` of a section."""
+        section_stats = self._section_stats.get(section_name)
+        if section_stats is None:
+            with self._lock:
+                section_stats = self._section_stats.setdefault(section_name, SectionStats())
+        return section_stats
+
+    def get_stats(self):
+        """Returns each section's load counts, cache hits, time spent, age and last error.
+
+        Example::
+
+            {"my_section": {"loads": 3, "unchanged": 2, "cache_hits": 120, ...}}
+
+        See :class:`turf.stats.SectionStats` for the fields.
+        """
+        return {section_name: section_stats.as_dict()
+                for section_name, section_stats in list(self._section_stats.items())}
+
+    def get_prometheus_stats(self, prefix="turf", labels=None):
+        """Returns :meth:`get_stats` in the Prometheus text exposition format.
+
+        :param dict labels: Extra labels added to every sample.
+        """
+        return to_prometheus(self.get_stats(), prefix=prefix, labels=labels)
 
 
     def get_file_path_for_section(self, section_name):
-        return os.path.join(self.get_config_dir(), "%s.yml" % section_name)
+        """Returns the path of a section's config file.
+
+        Each extension in :attr:`section_extensions` is tried in order,
+        using one listing of the config directory.  If no file exists the
+        first extension is used.
+        """
+        config_dir = self.get_config_dir()
+        if len(self.section_extensions) > 1:
+            file_names = self.list_config_dir()
+            for extension in self.section_extensions:
+                if section_name + extension in file_names:
+                    return os.path.join(config_dir, section_name + extension)
+        return os.path.join(config_dir, section_name + self.section_extensions[0])
+
+    def list_config_dir(self):
+        """Returns the names of the files in the config directory.
+
+        The listing is reused until the directory's modification time changes.
+        """
+        config_dir = self.get_config_dir()
+        try:
+            dir_mtime = os.stat(config_dir).st_mtime_ns
+        except FileNotFoundError:
+            return frozenset()
+        cached = self._config_dir_listing
+        if cached is not None and cached[0] == (config_dir, dir_mtime) and _mtime_is_settled(dir_mtime):
+            return cached[1]
+        file_names = frozenset(os.listdir(config_dir))
+        self._config_dir_listing = ((config_dir, dir_mtime), file_names)
+        return file_names
 
     def yaml_load(self, config_path):
         with open(config_path) as config_file_handle:
             if self.safe_load:
-                return yaml.safe_load(config_file_handle)
+                return yaml_util.safe_load(config_file_handle)
             else:
-                return yaml.load(config_file_handle)
+                return yaml_util.unsafe_load(config_file_handle)
+
+    def parse_file(self, config_path):
+        """Parses a config file in the format given by its extension (see :mod:`turf.formats`)."""
+        if isinstance(formats.get_format(config_path), formats.YamlFormat):
+            return self.yaml_load(config_path)
+        with open(config_path, "rb") as config_file_handle:
+            return self.parse_contents(config_path, config_file_handle.read())
+
+    def parse_contents(self, config_path, contents):
+        """Parses the contents of a config file in the format given by its extension."""
+        return formats.get_format(config_path).loads(contents, safe=self.safe_load)
 
 
     def read_section_from_file(self, section_name):
-        """Loads a section from its config file and parses the YAML."""
+        """Loads a section from its config file and parses it.
+
+        The file's modification time, size and inode are recorded each time
+        it is parsed.  While those are unchanged, the previously parsed
+        result is returned and the file is not opened again.
+        """
         config_path = self.get_file_path_for_section(section_name)
-        if os.path.exists(config_path):
-            return self.yaml_load(config_path)
+        signature = self.get_section_signature(section_name)
+        cached = self._sources.get(section_name)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+
+        if signature is None:
+            config_from_file = {}
         else:
-            return {}
+            timer = StageTimer()
+            config_from_file = self.parse_file(config_path)
+            timer.lap("parse")
+            self.record_read_timer(section_name, timer, bytes_read=signature[1])
+        self._sources[section_name] = (signature, config_from_file)
+        return config_from_file
+
+    def get_section_signature(self, section_name):
+        """Returns the (mtime, size, inode) of a section's file, or None if it does not exist."""
+        try:
+            config_stat = os.stat(self.get_file_path_for_section(section_name))
+        except FileNotFoundError:
+            return None
+        return (config_stat.st_mtime_ns, config_stat.st_size, config_stat.st_ino)
 
     def raise_validation_error(self, section, errors):
         message = "Errors validating section '{0}':\n\n{1}".format(section, errors)
         raise ValidationError(message, section, errors)
 
 class SingleFileConfig(BaseConfig):
+    """Provides a configuration manager with every section in one file.
+
+    The parsed file is kept in :attr:`file_data`, apart from the processed
+    sections in :attr:`data`.  The file is only read again when its
+    modification time, size or inode change, and only parsed again when its
+    contents differ.  Sections whose part of the file did not change keep
+    their previously validated values.
+
+    Which directory of the search path holds the file is also cached; see
+    :meth:`get_file_path`.
+    """
     config_file = None
     search_path = None
     data = None
     file_data = None
 
+    search_path_check_seconds = 1.0
+
     def __init__(self, *args, search_path=None, config_file=None, **kwargs):
         if search_path:
             self.search_path = search_path
         if config_file:
             self.config_file = config_file
+        self._file_signature = None
+        self._file_digest = None
+        self._file_lock = threading.RLock()
+        self._resolved_file = None
         super().__init__(*args, **kwargs)
 
+    def _reset_after_fork(self):
+        super()._reset_after_fork()
+        self._file_lock = threading.RLock()
+
+    def get_snapshot_path(self):
+        """Returns None; snapshots are not supported for single file configs yet."""
+        return self.ignore_snapshot_path("SingleFileConfig does not support snapshots")
+
     def get_config_search_path(self):
         if self.search_path is None:
             raise NotImplementedError("Must define search_path")
@@ -354,28 +1201,177 @@ class SingleFileConfig(BaseConfig):
             return self.search_path
 
     def get_file_path(self):
+        """Returns the path of the config file in the first search path directory that has it.
+
+        The result is cached with the modification times of the directories
+        that were searched, which change when a file is added to or removed
+        from them.  At most every :attr:`search_path_check_seconds` those
+        directories are checked with one ``stat`` each, and the search is
+        repeated if any of them changed.  This means the file appearing in
+        a directory earlier in the search path is still noticed.  In watch
+        mode the watcher clears the cache instead, and only directories that
+        did not exist are checked.
+        """
         if self.config_file is None:
             raise NotImplementedError("Must define config_file")
-        else:
-            for path in self.get_config_search_path():  # pylint: disable=not-an-iterable
-                if os.path.exists(os.path.join(path, self.config_file)):
-                    return os.path.join(path, self.config_file)
-
-    def refresh(self):
+        key = (self.config_file, tuple(self.get_config_search_path()))
+        resolved = self._resolved_file
+        if resolved is not None and resolved[0] == key and self._is_resolved_file_current(resolved):
+            return resolved[2]
+
+        directory_mtimes = []
+        config_path = None
+        for path in key[1]:
+            # Stat the directory first so that a file added after the check changes its mtime
+            directory_mtimes.append((path, self._get_directory_mtime(path)))
+            if os.path.exists(os.path.join(path, self.config_file)):
+                config_path = os.path.join(path, self.config_file)
+                break
+        self._resolved_file = (key, tuple(directory_mtimes), config_path, time.monotonic())
+        return config_path
+
+    def _is_resolved_file_current(self, resolved):
+        key, directory_mtimes, config_path, checked_at = resolved
+        now = time.monotonic()
+        if now - checked_at < self.search_path_check_seconds:
+            return True
+        watching = self._watcher is not None
+        for path, mtime in directory_mtimes:
+            if watching and mtime is not None:
+                continue
+            if self._get_directory_mtime(path) != mtime:
+                return False
+            if mtime is not None and not _mtime_is_settled(mtime):
+                return False
+        self._resolved_file = (key, directory_mtimes, config_path, now)
+        return True
+
+    def _get_directory_mtime(self, path):
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+    def clear_file_path_cache(self):
+        """Makes the next :meth:`get_file_path` search the search path again."""
+        self._resolved_file = None
+
+    def load_file(self):
+        """Returns the parsed config file, or an empty dict if there is none.
+
+        The result is cached in :attr:`file_data` and reused while the file's
+        path, modification time, size and inode are unchanged.  After the
+        file changes it is read and hashed, and only parsed if its contents
+        differ.  Sections that parse to the same settings as before keep the
+        previous objects (see :meth:`reuse_unchanged_sections`).
+        """
         config_path = self.get_file_path()
-        if config_path and os.path.exists(config_path):
-            self.data = self.yaml_load(config_path)
-        else:
-            self.data = {}
+        if not config_path:
+            return {}
+        with self._file_lock:
+            signature = self.get_file_signature(config_path)
+            if signature is None:
+                # The file was removed since the search path was checked
+                self.clear_file_path_cache()
+                return {}
+            if signature == self._file_signature and self.file_data is not None:
+                return self.file_data
+            with open(config_path, "rb") as config_file_handle:
+                contents = config_file_handle.read()
+            digest = hashlib.sha1(contents).hexdigest()
+            self._file_signature = signature
+            if digest == self._file_digest and self.file_data is not None:
+                return self.file_data
+            file_data = self.parse_contents(config_path, contents)
+            if not hasattr(file_data, "items"):
+                file_data = {}
+            self.file_data = self.reuse_unchanged_sections(file_data)
+            self._file_digest = digest
+            return self.file_data
+
+    def get_file_signature(self, config_path):
+        """Returns the (path, mtime, size, inode) of the config file, or None if it cannot be read."""
+        try:
+            config_stat = os.stat(config_path)
+        except OSError:
+            return None
+        return (config_path, config_stat.st_mtime_ns, config_stat.st_size, config_stat.st_ino)
+
+    def reuse_unchanged_sections(self, file_data):
+        """Replaces sections identical to those in :attr:`file_data` with the previous objects.
+
+        Sections are compared with :func:`identical_settings`, so a change of
+        type such as ``1`` to ``true`` is not mistaken for an unchanged value.
+
+        :meth:`load_section` recognises them and returns their previously
+        validated values without merging or validating them again.
+        """
+        previous = self.file_data or {}
+        reused = {}
+        for section_name, section_data in file_data.items():
+            previous_data = previous.get(section_name)
+            if previous_data is not None and identical_settings(previous_data, section_data):
+                section_data = previous_data
+            reused[section_name] = section_data
+        return reused
+
+    def refresh(self, raise_errors=True):
+        """Reloads every section in the file.
+
+        A section that fails but keeps its last good value (see
+        :meth:`section_failed`) does not stop the others from loading; its
+        error is raised afterwards unless ``raise_errors`` is False.
+
+        Each section's lock is held from its load until the new :attr:`data`
+        is published, so sections reloaded on access by other threads are
+        neither loaded concurrently nor overwritten.  Locks are taken in
+        sorted order so that concurrent refreshes cannot deadlock.
+        """
+        file_data = self.load_file()
+        self.file_data = file_data
         defaults = self.get_defaults()
         schema = self.get_schema()
 
-        keys = set(list(self.data.keys()) + list(defaults.keys()))
-
-        for section_name in keys:
-            section_defaults = defaults.get(section_name, {})
-            section_schema = schema[section_name]
-            self.data[section_name] = self.load_section(section_name, section_defaults, section_schema)
+        keys = sorted(set(list(file_data.keys()) + list(defaults.keys())))
+
+        loaded = {}
+        failed = []
+        first_error = None
+        with ExitStack() as stack:
+            for section_name in keys:
+                stack.enter_context(self.get_section_lock(section_name))
+                section_defaults = defaults.get(section_name, {})
+                section_schema = schema[section_name]
+                try:
+                    section_config = self.load_section(section_name, section_defaults, section_schema)
+                except Exception as load_error:
+                    if not self.section_failed(section_name, load_error):
+                        raise
+                    failed.append(section_name)
+                    if first_error is None:
+                        first_error = load_error
+                    continue
+                if self.immutable:
+                    section_config = self._freeze_section(section_name, section_config)
+                loaded[section_name] = section_config
+            with self._lock:
+                data = {section_name: self.data[section_name] for section_name in failed}
+                data.update(loaded)
+                self.data = data
+            for section_name in loaded:
+                self.schedule_section(section_name)
+                self.refresh_errors.pop(section_name, None)
+        if raise_errors and first_error is not None:
+            raise first_error
 
     def read_section_from_file(self, section_name):
-        return self.data.get(section_name, {})
+        """Returns a section's part of the config file, reloading the file if it changed."""
+        return self.load_file().get(section_name, {})
+
+    def get_watch_directories(self):
+        return list(self.get_config_search_path())
+
+    def files_changed(self, paths):
+        if paths is None or self.config_file in set(os.path.basename(path) for path in paths):
+            self.clear_file_path_cache()
+            self.refresh(raise_errors=False)
@@ -0,0 +1,69 @@
+"""Envelope encryption for configuration stored by :class:`turf.s3config.S3Config`.
+
+A KMS data key encrypts the configuration locally with AES-GCM, so
+configs are not limited by the size KMS will encrypt directly and only
+the small wrapped data key needs a KMS round trip to read.
+
+Objects are stored as::
+
+    TURFENV1:<base64 wrapped data key>:<base64 nonce + ciphertext>
+
+The header cannot appear in the older format, which is plain base64.
+Requires the ``cryptography`` package (``pip install turf[envelope]``).
+"""
+import base64
+import os
+
+try:
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+except ImportError:  # pragma: no cover
+    AESGCM = None
+
+HEADER = b"TURFENV1:"
+NONCE_BYTES = 12
+
+
+def _require_aesgcm():
+    if AESGCM is None:
+        raise ImportError("Envelope encryption requires the cryptography package")
+
+
+def is_envelope(body):
+    """Returns True if an S3 object body is in the envelope format."""
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    return body.startswith(HEADER)
+
+
+def seal(plaintext, data_key, wrapped_key):
+    """Encrypts ``plaintext`` with ``data_key`` and returns the envelope body.
+
+    :param bytes data_key: The plaintext data key from KMS GenerateDataKey.
+    :param bytes wrapped_key: The KMS encrypted copy of ``data_key``.
+    """
+    _require_aesgcm()
+    if isinstance(plaintext, str):
+        plaintext = plaintext.encode("utf-8")
+    nonce = os.urandom(NONCE_BYTES)
+    ciphertext = AESGCM(data_key).encrypt(nonce, plaintext, HEADER)
+    return b"".join([
+        HEADER,
+        base64.b64encode(wrapped_key),
+        b":",
+        base64.b64encode(nonce + ciphertext)
+    ])
+
+
+def unpack(body):
+    """Splits an envelope body into its wrapped data key and encrypted payload."""
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    wrapped_key, payload = body[len(HEADER):].split(b":", 1)
+    return base64.b64decode(wrapped_key), base64.b64decode(payload)
+
+
+def open_payload(payload, data_key):
+    """Decrypts a payload returned by :func:`unpack` with the unwrapped data key."""
+    _require_aesgcm()
+    nonce, ciphertext = payload[:NONCE_BYTES], payload[NONCE_BYTES:]
+    return AESGCM(data_key).decrypt(nonce, ciphertext, HEADER)
@@ -9,3 +9,5 @@ class ValidationError(Exception):
         super().__init__(msg)
         self.section = section
         self.errors = errors
+
+class CircuitOpenError(Exception): pass
@@ -0,0 +1,73 @@
+"""Provides the file formats configuration sections can be stored in.
+
+Formats are chosen by file extension.  YAML (``.yml``, ``.yaml``) and JSON
+(``.json``) are always available, and msgpack (``.msgpack``) is available
+when the ``msgpack`` package is installed (``pip install turf[msgpack]``).
+Other formats can be added with :func:`register_format`.
+"""
+import json
+import os
+
+from . import yaml_util
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+
+class SectionFormat(object):
+    """Parses the contents of a config file.  Subclass this to add a format."""
+
+    def loads(self, contents, safe=True):
+        """Returns the settings parsed from ``contents`` (bytes or str).
+
+        :param bool safe: Whether the format should refuse to create
+            arbitrary objects.  Only meaningful for YAML.
+        """
+        raise NotImplementedError
+
+
+class YamlFormat(SectionFormat):
+
+    def loads(self, contents, safe=True):
+        return yaml_util.load(contents, safe=safe)
+
+
+class JsonFormat(SectionFormat):
+
+    def loads(self, contents, safe=True):
+        if isinstance(contents, bytes):
+            contents = contents.decode("utf-8")
+        return json.loads(contents)
+
+
+class MsgpackFormat(SectionFormat):
+
+    def loads(self, contents, safe=True):
+        if msgpack is None:
+            raise ImportError("Reading .msgpack sections requires the msgpack package")
+        return msgpack.unpackb(contents, raw=False)
+
+
+_formats = {}
+
+
+def register_format(extension, section_format):
+    """Registers a :class:`SectionFormat` for files ending in ``extension`` (like ".json")."""
+    _formats[extension] = section_format
+
+
+def get_format(path):
+    """Returns the :class:`SectionFormat` for a file path or S3 key, based on its extension."""
+    extension = os.path.splitext(path)[1]
+    try:
+        return _formats[extension]
+    except KeyError:
+        raise ValueError("No section format registered for '{0}'".format(extension)) from None
+
+
+register_format(".yml", YamlFormat())
+register_format(".yaml", YamlFormat())
+register_format(".json", JsonFormat())
+register_format(".msgpack", MsgpackFormat())
@@ -0,0 +1,32 @@
+"""Provides read-only versions of configuration sections"""
+from collections.abc import Mapping
+from types import MappingProxyType
+
+
+def freeze(value):
+    """Returns a read-only deep copy of a configuration value.
+
+    Mappings become :class:`types.MappingProxyType`, lists and tuples become
+    tuples and sets become frozensets.  Other values are returned as-is.
+    """
+    if isinstance(value, Mapping):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    if isinstance(value, (set, frozenset)):
+        return frozenset(freeze(item) for item in value)
+    return value
+
+
+def thaw(value):
+    """Returns a mutable deep copy of a value returned by :func:`freeze`.
+
+    Mappings become dicts, tuples become lists and frozensets become sets.
+    """
+    if isinstance(value, Mapping):
+        return {key: thaw(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [thaw(item) for item in value]
+    if isinstance(value, (set, frozenset)):
+        return set(thaw(item) for item in value)
+    return value
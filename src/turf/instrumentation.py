@@ -0,0 +1,125 @@
+"""Provides sinks that receive how long each stage of loading a section took.
+
+Register sinks with ``timing_sinks`` (or :meth:`turf.config.BaseConfig.add_timing_sink`).
+After each section is loaded, every sink's :meth:`TimingSink.record_section`
+is called with the section's :class:`turf.config.StageTimer`.  When no sink
+is registered nothing is emitted.
+
+The stages are:
+
+- ``validate_defaults``, ``read``, ``prehook``, ``validate_prehook``,
+  ``merge``, ``validate``, ``posthook`` and ``validate_final`` from
+  :meth:`turf.config.BaseConfig.load_section`
+- ``parse`` for config files, and ``s3_get``, ``kms_decrypt`` and
+  ``parse`` for S3Config, which are part of ``read``
+
+Sinks are called on the thread that loaded the section, so they must be
+thread-safe.  Exceptions raised by a sink are logged and ignored.
+"""
+import logging
+
+try:
+    from opentelemetry import trace
+except ImportError:  # pragma: no cover
+    trace = None
+
+logger = logging.getLogger(__name__)
+
+
+class TimingSink(object):
+    """Receives stage timings.  Subclass this and override :meth:`record`,
+    or :meth:`record_section` to receive all of a section's stages at once.
+    """
+
+    def record(self, section_name, stage, seconds):
+        raise NotImplementedError
+
+    def record_section(self, section_name, timer):
+        """Called once per load of a section.
+
+        :param timer: The :class:`turf.config.StageTimer` of the load.
+            ``timer.timings`` maps each stage to its duration in seconds.
+        """
+        for stage, seconds in timer.timings.items():
+            self.record(section_name, stage, seconds)
+
+
+class CallbackSink(TimingSink):
+    """Calls ``callback(section_name, stage, seconds)`` for each stage."""
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def record(self, section_name, stage, seconds):
+        self.callback(section_name, stage, seconds)
+
+
+class LoggingSink(TimingSink):
+    """Logs one line with every stage's duration each time a section is loaded."""
+
+    def __init__(self, log=None, level=logging.DEBUG):
+        self.log = log or logger
+        self.level = level
+
+    def record_section(self, section_name, timer):
+        if self.log.isEnabledFor(self.level):
+            self.log.log(self.level, "Loaded section %s: %s", section_name, ", ".join(
+                "{0}={1:.3f}ms".format(stage, seconds * 1e3) for stage, seconds in timer.timings.items()))
+
+
+class StatsdSink(TimingSink):
+    """Sends each stage to a statsd-style client as ``<prefix>.<section>.<stage>``.
+
+    :param client: Any object with a ``timing(name, milliseconds)`` method,
+        such as ``statsd.StatsClient``.
+    """
+
+    def __init__(self, client, prefix="turf"):
+        self.client = client
+        self.prefix = prefix
+
+    def record(self, section_name, stage, seconds):
+        self.client.timing("{0}.{1}.{2}".format(self.prefix, section_name, stage), seconds * 1e3)
+
+
+class SpanSink(TimingSink):
+    """Records each load as an OpenTelemetry span with a child span per stage.
+
+    :param tracer: An ``opentelemetry.trace.Tracer``.
+    """
+
+    def __init__(self, tracer, name="turf.load_section"):
+        if trace is None:
+            raise ImportError("SpanSink requires the opentelemetry-api package")
+        self.tracer = tracer
+        self.name = name
+
+    def record_section(self, section_name, timer):
+        start_ns = int(timer.started * 1e9)
+        end_ns = start_ns + int(timer.elapsed() * 1e9)
+        span = self.tracer.start_span(self.name, start_time=start_ns,
+                                      attributes={"turf.section": section_name})
+        context = trace.set_span_in_context(span)
+        for stage, seconds in timer.timings.items():
+            stage_start_ns = start_ns + int(timer.starts[stage] * 1e9)
+            stage_span = self.tracer.start_span("turf." + stage, context=context,
+                                                start_time=stage_start_ns)
+            stage_span.end(end_time=stage_start_ns + int(seconds * 1e9))
+        span.end(end_time=end_ns)
+
+
+def as_timing_sink(sink):
+    """Returns ``sink``, wrapping plain callables in a :class:`CallbackSink`."""
+    if hasattr(sink, "record_section"):
+        return sink
+    if callable(sink):
+        return CallbackSink(sink)
+    raise TypeError("Timing sinks must be callables or have a record_section method")
+
+
+def emit(sinks, section_name, timer):
+    for sink in sinks:
+        try:
+            sink.record_section(section_name, timer)
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Error recording timings for section %s", section_name)
@@ -0,0 +1,110 @@
+"""Provides refresh policies, which decide when each section is reloaded.
+
+Policies are declared next to the schema::
+
+    from turf.policies import MaxStaleness, Never, OnChange, TTL
+
+    class MyConfig(BaseConfig):
+        schema = {"topology": {...}, "flags": {...}, "limits": {...}}
+        refresh_policies = {
+            "topology": Never(),
+            "flags": TTL(5),
+            "limits": MaxStaleness(30, 300),
+        }
+
+Sections without a policy use ``TTL(refresh_seconds)``, or :class:`Never`
+if ``refresh_seconds`` is None.
+
+When a section is loaded its policy is asked for deadlines, which are
+stored so that accessing a section only compares the current time with
+its deadline.  Times come from :func:`time.monotonic`, so changes to the
+wall clock neither trigger nor delay reloads.
+"""
+import math
+
+EXPIRED = -math.inf
+
+
+class RefreshPolicy(object):
+    """Decides when a section expires.  Subclass this to write your own policy."""
+
+    #: Serve the expired value while the section is reloaded in the background.
+    stale_while_revalidate = False
+
+    def get_refresh_deadline(self, config, loaded_at):
+        """Returns the monotonic time from which accessing the section reloads it.
+
+        :param config: The config the section belongs to.
+        :param float loaded_at: The monotonic time the section was loaded.
+        """
+        raise NotImplementedError
+
+    def get_stale_deadline(self, config, loaded_at):
+        """Returns the monotonic time from which an expired value may no longer be served.
+
+        Only used when stale values are served (see
+        :attr:`stale_while_revalidate`).  Defaults to the config's
+        ``max_staleness_seconds``.
+        """
+        if config.max_staleness_seconds is None:
+            return math.inf
+        return loaded_at + config.max_staleness_seconds
+
+
+class Never(RefreshPolicy):
+    """Loads a section once.  It is only reloaded by ``refresh()`` or when invalidated."""
+
+    def get_refresh_deadline(self, config, loaded_at):
+        return math.inf
+
+
+class TTL(RefreshPolicy):
+    """Reloads a section on the first access ``seconds`` after it was loaded."""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def get_refresh_deadline(self, config, loaded_at):
+        return loaded_at + self.seconds
+
+
+class OnChange(RefreshPolicy):
+    """Reloads a section only when its source changes.
+
+    In watch mode the watcher invalidates the section when its file changes,
+    so it never expires.  Otherwise the source is checked on the first access
+    ``check_seconds`` after each load.  A check of an unchanged source reuses
+    the previous value without parsing or validating it.
+    """
+
+    def __init__(self, check_seconds=60):
+        self.check_seconds = check_seconds
+
+    def get_refresh_deadline(self, config, loaded_at):
+        if config.watch:
+            return math.inf
+        return loaded_at + self.check_seconds
+
+
+class MaxStaleness(RefreshPolicy):
+    """Reloads a section in the background ``seconds`` after it was loaded.
+
+    The previous value is served while it is reloaded.  Once it is
+    ``max_staleness_seconds`` old, accesses wait for the reload instead.
+
+    :param max_staleness_seconds: If None, the config's
+        ``max_staleness_seconds`` is used.
+    """
+    stale_while_revalidate = True
+
+    def __init__(self, seconds, max_staleness_seconds=None):
+        self.seconds = seconds
+        self.max_staleness_seconds = max_staleness_seconds
+
+    def get_refresh_deadline(self, config, loaded_at):
+        return loaded_at + self.seconds
+
+    def get_stale_deadline(self, config, loaded_at):
+        if self.max_staleness_seconds is None:
+            return super().get_stale_deadline(config, loaded_at)
+        return loaded_at + self.max_staleness_seconds
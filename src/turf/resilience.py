@@ -0,0 +1,82 @@
+"""Provides circuit breakers and backoff for reloading sections from unreliable backends."""
+import random
+import threading
+import time
+
+from .errors import CircuitOpenError
+
+
+def backoff_delay(failures, base_seconds, max_seconds):
+    """Returns how long to wait before retrying after ``failures`` consecutive failures.
+
+    The delay doubles with each failure up to ``max_seconds``, and a random
+    half of it is dropped so that processes which failed together do not
+    retry together.
+    """
+    delay = min(max_seconds, base_seconds * 2 ** max(failures - 1, 0))
+    return random.uniform(delay / 2, delay)
+
+
+def jitter_deadline(loaded_at, deadline, jitter):
+    """Moves a deadline earlier by a random fraction, up to ``jitter``, of its interval.
+
+    Processes that load a section at the same time then spread their
+    reloads out instead of reloading together.  Deadlines are never moved
+    later, so a section is never older than its policy allows.
+    """
+    if not jitter or deadline == float("inf"):
+        return deadline
+    return deadline - (deadline - loaded_at) * jitter * random.random()
+
+
+class CircuitBreaker(object):
+    """Stops calling a backend that keeps failing.
+
+    After ``failure_threshold`` consecutive failures the circuit opens and
+    :meth:`before_call` raises :class:`turf.errors.CircuitOpenError` for
+    ``reset_seconds``.  Then one trial call is let through: the circuit
+    closes if it succeeds and opens again if it fails.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_seconds=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if self._trial or time.monotonic() - self.opened_at < self.reset_seconds:
+            return "open"
+        return "half_open"
+
+    def before_call(self):
+        """Raises :class:`turf.errors.CircuitOpenError` if the backend should not be called."""
+        if self.opened_at is None:
+            return
+        with self._lock:
+            if self.opened_at is None:
+                return
+            if self._trial or time.monotonic() - self.opened_at < self.reset_seconds:
+                raise CircuitOpenError("Not calling {0} after {1} consecutive failures".format(
+                    self.name, self.failures))
+            self._trial = True
+
+    def record_success(self):
+        if self.failures or self.opened_at is not None:
+            with self._lock:
+                self.failures = 0
+                self.opened_at = None
+                self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._trial = False
@@ -1,13 +1,50 @@
 import base64
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import logging
+import os
+import threading
+import time
 
 import botocore
+import botocore.config
 import boto3
 import cerberus
-import yaml
 
-from .config import BaseConfig
+from . import envelope, formats
+from .cache import TTLCache
+from .config import BaseConfig, StageTimer
 from .errors import ConfigurationNotFoundError
 
+logger = logging.getLogger(__name__)
+
+
+_client_lock = threading.Lock()
+_shared_clients = {}
+
+
+def _reset_clients_after_fork():
+    global _client_lock  # pylint: disable=global-statement
+    _client_lock = threading.Lock()
+    _shared_clients.clear()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_clients_after_fork)
+
+
+THROTTLING_ERROR_CODES = frozenset([
+    "Throttling", "ThrottlingException", "ThrottledException", "RequestThrottled",
+    "RequestLimitExceeded", "SlowDown", "TooManyRequestsException", "KMSInternalException",
+    "RequestTimeout", "RequestTimeoutException"
+])
+
+
+def is_not_modified(client_error):
+    """Returns True if a botocore ClientError is a 304 response to a conditional request."""
+    status = client_error.response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+    code = client_error.response.get("Error", {}).get("Code")
+    return status == 304 or code in ("304", "NotModified")
+
 
 class S3Config(BaseConfig):
     """Provides a class for a configuration manager, with configs stored in S3.
@@ -24,13 +61,202 @@ class S3Config(BaseConfig):
     configuration.
 
     If :attr:`encrypted` is True, turf assumes that the configuration has been
-    encrypted using KMS prior to storing in S3.
+    encrypted using KMS prior to storing in S3.  If
+    :attr:`envelope_encryption` is also True, :meth:`save_config` encrypts
+    configs locally with a KMS data key (see :mod:`turf.envelope`); both
+    formats can always be read.  Decrypted plaintext is kept
+    in memory for up to :attr:`decrypt_cache_seconds`, so unchanged
+    ciphertext is not sent to KMS again; set :attr:`decrypt_cache_size` to
+    0 to disable this.
+
+    AWS clients are created once per instance and reused, keeping their
+    connection pools alive between reads.  Set :attr:`share_aws_clients` to
+    share them between every S3Config in the process.
+
+    If :attr:`list_sections` is True, each refresh lists the config folder
+    once and skips requests for sections with no file or an unchanged ETag.
+    Listing is also used to find each section's file when there is more than
+    one of :attr:`section_extensions`.
+
+    Calls to S3 and KMS go through a circuit breaker per service (see
+    :meth:`call_backend`), and errors reading a section are raised so that
+    the last good value is kept (see :meth:`section_failed`).
     """
     encrypted = False
+    envelope_encryption = False
+    decrypt_cache_size = 128
+    decrypt_cache_seconds = 3600
+
+    max_workers = 8
+
+    list_sections = False
+    listing_seconds = None
+
+    share_aws_clients = False
+    aws_max_pool_connections = 10
+    aws_connect_timeout = 5
+    aws_read_timeout = 10
+    aws_max_attempts = 3
+
+
+    def __init__(self, *args, **kwargs):
+        self._aws_clients = {}
+        self._decrypt_cache = TTLCache(self.decrypt_cache_size, self.decrypt_cache_seconds)
+        self._listing = None
+        self._listing_time = None
+        self._source_checked = {}
+        super().__init__(*args, **kwargs)
+
+
+    def _reset_after_fork(self):
+        super()._reset_after_fork()
+        self._decrypt_cache = TTLCache(self.decrypt_cache_size, self.decrypt_cache_seconds)
+
+
+    def get_snapshot_path(self):
+        """Returns :attr:`snapshot_path`, or None for encrypted configs.
+
+        A snapshot holds parsed sections, so for encrypted configs it would
+        put the decrypted settings on disk.  ``snapshot_path`` is ignored for
+        them, with a warning.
+        """
+        if self.encrypted:
+            return self.ignore_snapshot_path(
+                "snapshots of encrypted configs would store decrypted settings on disk")
+        return self.snapshot_path
+
+
+    def get_aws_client_config(self):
+        """Returns the botocore config used when creating AWS clients."""
+        return botocore.config.Config(
+            max_pool_connections=self.aws_max_pool_connections,
+            connect_timeout=self.aws_connect_timeout,
+            read_timeout=self.aws_read_timeout,
+            retries={"max_attempts": self.aws_max_attempts}
+        )
 
 
     def get_aws_client(self, service):
-        return boto3.client(service)
+        """Returns a cached boto3 client for an AWS service.
+
+        Clients are recreated if the process has forked since they were made.
+        """
+        if self.share_aws_clients:
+            clients = _shared_clients
+            key = (service, self.aws_max_pool_connections, self.aws_connect_timeout,
+                   self.aws_read_timeout, self.aws_max_attempts)
+        else:
+            clients = self._aws_clients
+            key = service
+        pid = os.getpid()
+        cached = clients.get(key)
+        if cached is not None and cached[0] == pid:
+            return cached[1]
+        # boto3's default session is not safe to create clients from concurrently
+        with _client_lock:
+            cached = clients.get(key)
+            if cached is None or cached[0] != pid:
+                cached = (pid, boto3.client(service, config=self.get_aws_client_config()))
+                clients[key] = cached
+        return cached[1]
+
+
+    def refresh_sections(self, section_names, raise_errors=True):
+        """Reloads the named sections concurrently.
+
+        Sections are fetched, decrypted and validated on a thread pool of at
+        most :attr:`max_workers` threads.  Every section is attempted; if any
+        fail, the error from the first failing section in ``section_names``
+        is raised once the others have finished.
+        """
+        section_names = list(section_names)
+        if self.uses_listing() and section_names:
+            self.list_before_refresh()
+        if len(section_names) < 2 or self.max_workers < 2:
+            return super().refresh_sections(section_names, raise_errors=raise_errors)
+
+        schema = self.get_schema()
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(section_names))) as executor:
+            futures = [
+                executor.submit(self.refresh_section, section_name, schema[section_name], raise_errors)
+                for section_name in section_names
+            ]
+        for future in futures:
+            future.result()
+
+
+    def list_before_refresh(self):
+        """Lists the config folder ahead of refreshing sections.
+
+        If listing fails, the error is logged and each section is read with
+        its own request.  Those reads fail or succeed on their own, so
+        failures are recorded per section (see :meth:`section_failed`).
+        """
+        try:
+            self.list_section_objects()
+        except Exception as listing_error:  # pylint: disable=broad-except
+            logger.warning("Unable to list %s, reading sections individually: %r",
+                           self.get_config_dir(), listing_error)
+
+
+    def list_section_objects(self):
+        """Lists the config folder with ListObjectsV2.
+
+        The listing maps each key to its ``(ETag, Size)`` and is used by
+        :meth:`read_section_from_file` for :attr:`listing_seconds` (defaulting
+        to :attr:`refresh_seconds`) after it is made.
+        """
+        s3_client = self.get_aws_client("s3")
+        bucket = self.get_s3_bucket()
+        listing = {}
+
+        def list_objects():
+            for page in s3_client.get_paginator("list_objects_v2").paginate(
+                    Bucket=bucket, Prefix=self.get_s3_prefix()):
+                for s3_object in page.get("Contents", []):
+                    listing[s3_object["Key"]] = (s3_object["ETag"], s3_object["Size"])
+
+        try:
+            self.call_backend("s3", list_objects)
+        except botocore.exceptions.ClientError as client_error:
+            if "NoSuchBucket" in repr(client_error):
+                raise ConfigurationNotFoundError("Unable to get config from bucket: {0}: {1}".format(
+                    bucket, repr(client_error)
+                    )
+                )
+            raise
+        self._listing = listing
+        self._listing_time = time.monotonic()
+        return listing
+
+
+    def uses_listing(self):
+        return self.list_sections or len(self.section_extensions) > 1
+
+
+    def get_current_listing(self):
+        """Returns the most recent listing if it is still fresh, otherwise None."""
+        if not self.uses_listing() or self._listing is None:
+            return None
+        max_age = self.listing_seconds
+        if max_age is None:
+            max_age = self.refresh_seconds
+        if max_age is not None and time.monotonic() - self._listing_time > max_age:
+            return None
+        return self._listing
+
+
+    def get_s3_prefix(self):
+        """Returns the key prefix shared by every section in :attr:`config_dir`."""
+        s3_path = self.get_config_dir().split("/")
+        if len(s3_path) == 1:
+            return ""
+        return "{0}/".format("/".join(s3_path[1:]))
+
+
+    def get_source_digest(self, section_name, signature):
+        # ETags already identify the content of each object
+        return None
 
 
     def get_s3_bucket(self):
@@ -40,32 +266,85 @@ class S3Config(BaseConfig):
         return s3_bucket
 
 
-    def get_s3_path(self, section_name):
+    def get_s3_path(self, section_name, extension=None):
+        """Returns the key of a section's object.
+
+        :param str extension: The extension to use.  If not given, the first
+            of :attr:`section_extensions` with an object in the listing is
+            used, or the first extension if none have one.
+        """
+        if extension is None:
+            extension = self.resolve_section_extension(section_name)
         s3_path = self.get_config_dir().split("/")
         if len(s3_path) == 1:
             # Configs are in root of bucket
             s3_path = ""
-            s3_filename = "{0}.yml".format(section_name)
+            s3_filename = "{0}{1}".format(section_name, extension)
             return s3_filename
         else:
             # Configs are in a folder in a bucket
             s3_path = "/".join(s3_path[1:])
-        s3_filename = "{0}.yml".format(section_name)
+        s3_filename = "{0}{1}".format(section_name, extension)
         return "{0}/{1}".format(s3_path, s3_filename)
 
 
+    def resolve_section_extension(self, section_name):
+        if len(self.section_extensions) == 1:
+            return self.section_extensions[0]
+        listing = self.get_current_listing()
+        if listing is None:
+            listing = self.list_section_objects()
+        for extension in self.section_extensions:
+            if self.get_s3_path(section_name, extension) in listing:
+                return extension
+        return self.section_extensions[0]
+
+
     def read_section_from_file(self, section_name):
-        """Loads a section from S3 and parses the YAML."""
+        """Loads a section from S3 and parses it in the format given by its extension.
+
+        The ETag of each section is remembered and sent as ``IfNoneMatch``
+        on the next read.  If S3 responds that the object is not modified,
+        the previously parsed section is returned without downloading it.
+
+        While a listing from :meth:`list_section_objects` is current and
+        was made after the section was last checked, no request is made for
+        sections missing from the listing or whose listed ETag matches the
+        cached one.  A section that expires between listings is checked with
+        a conditional GET instead, so changes are not missed.
+
+        Errors downloading or decrypting the section are raised.
+        """
         s3_client = self.get_aws_client("s3")
         bucket = self.get_s3_bucket()
+        key = self.get_s3_path(section_name)
+        cached = self._sources.get(section_name)
+
+        listing = self.get_current_listing()
+        checked = self._source_checked.get(section_name)
+        self._source_checked[section_name] = time.monotonic()
+        if listing is not None and (checked is None or self._listing_time > checked):
+            if key not in listing:
+                return self._section_not_found(section_name)
+            if cached is not None and cached[0] == listing[key][0]:
+                return cached[1]
+
+        request = {
+            "Bucket": bucket,
+            "Key": key
+        }
+        if cached is not None and cached[0] is not None:
+            request["IfNoneMatch"] = cached[0]
+        timer = StageTimer()
         try:
-            s3_response = s3_client.get_object(
-                Bucket=bucket,
-                Key=self.get_s3_path(section_name)
-            )
+            s3_response = self.call_backend("s3", s3_client.get_object, **request)
         except botocore.exceptions.ClientError as client_error:
-            if "NoSuchKey" in repr(client_error):
-                return {}
+            if cached is not None and is_not_modified(client_error):
+                timer.lap("s3_get")
+                self.record_read_timer(section_name, timer)
+                return cached[1]
+            elif "NoSuchKey" in repr(client_error):
+                return self._section_not_found(section_name)
             elif "NoSuchBucket" in repr(client_error):
                 raise ConfigurationNotFoundError("Unable to get config from bucket: {0}: {1}".format(
                     bucket, repr(client_error)
@@ -74,40 +353,74 @@ class S3Config(BaseConfig):
             else:
                 raise
 
-        try:
-            config_file_contents = s3_response["Body"].read(s3_response["ContentLength"])
-        except:
-            return {}
+        config_file_contents = self.call_backend(
+            "s3", s3_response["Body"].read, s3_response["ContentLength"])
+        timer.lap("s3_get")
+        raw_contents = config_file_contents
 
         if self.encrypted:
-            try:
-                kms = self.get_aws_client("kms")
-                kms_response = kms.decrypt(
-                    CiphertextBlob=base64.b64decode(config_file_contents)
-                )
-                config_file_contents = kms_response["Plaintext"]
-            except:
-                return {}
+            config_file_contents = self.decrypt_contents(config_file_contents)
+            timer.lap("kms_decrypt")
 
-        if self.safe_load:
-            config_from_file = yaml.safe_load(config_file_contents)
-        else:
-            config_from_file = yaml.load(config_file_contents)
+        config_from_file = formats.get_format(key).loads(config_file_contents, safe=self.safe_load)
+        timer.lap("parse")
+        self.record_read_timer(section_name, timer, bytes_read=len(raw_contents))
 
         if not hasattr(config_from_file, "items"):
-            return {}
+            config_from_file = {}
+        etag = s3_response.get("ETag")
+        if etag is not None:
+            self._sources[section_name] = (etag, config_from_file)
         return config_from_file
 
+    def kms_decrypt(self, ciphertext):
+        """Decrypts a KMS ciphertext blob, caching the plaintext by the ciphertext's digest."""
+        digest = hashlib.sha256(ciphertext).digest()
+        plaintext = self._decrypt_cache.get(digest)
+        if plaintext is None:
+            kms = self.get_aws_client("kms")
+            plaintext = self.call_backend("kms", kms.decrypt, CiphertextBlob=ciphertext)["Plaintext"]
+            self._decrypt_cache.set(digest, plaintext)
+        return plaintext
+
+    def decrypt_contents(self, config_file_contents):
+        """Decrypts an S3 object body in either the envelope or the KMS-only format.
+
+        Envelope bodies are decrypted locally once their data key has been
+        unwrapped by :meth:`kms_decrypt`, which caches the data key.
+        """
+        if envelope.is_envelope(config_file_contents):
+            wrapped_key, payload = envelope.unpack(config_file_contents)
+            return envelope.open_payload(payload, self.kms_decrypt(wrapped_key))
+        return self.kms_decrypt(base64.b64decode(config_file_contents))
+
+    def is_backend_failure(self, error):
+        """Returns True for errors that suggest S3 or KMS is unavailable or overloaded.
+
+        These are connection errors, timeouts, 5xx responses and throttling.
+        Other error responses, such as a missing key, do not count.
+        """
+        if isinstance(error, botocore.exceptions.ClientError):
+            status = error.response.get("ResponseMetadata", {}).get("HTTPStatusCode") or 0
+            code = error.response.get("Error", {}).get("Code")
+            return status >= 500 or status == 429 or code in THROTTLING_ERROR_CODES
+        return True
+
+    def _section_not_found(self, section_name):
+        cached = self._sources.get(section_name)
+        if cached is None or cached[0] is not None:
+            cached = self._sources[section_name] = (None, {})
+        return cached[1]
+
     @classmethod
-    def save_config(cls, config_file_contents, section_name, config=None, kms_key=None):
+    def save_config(cls, config_file_contents, section_name, config=None, kms_key=None,
+                    envelope_encryption=None, extension=None):
         if config is None:
             config = cls()
         s3_client = config.get_aws_client("s3")
+        key = config.get_s3_path(section_name, extension)
 
-        if config.safe_load:
-            config_dict = yaml.safe_load(config_file_contents)
-        else:
-            config_dict = yaml.load(config_file_contents)
+        config_dict = formats.get_format(key).loads(config_file_contents, safe=config.safe_load)
 
         validator = config.get_validator(config.schema[section_name])
         valid = validator.validate(config_dict)
@@ -115,7 +428,18 @@ class S3Config(BaseConfig):
         if not valid:
             raise cerberus.ValidationError(",".join(["{0}: {1}".format(k, v) for (k, v) in validator.errors.items()]))
 
-        if config.encrypted:
+        if envelope_encryption is None:
+            envelope_encryption = config.envelope_encryption
+
+        if config.encrypted and envelope_encryption:
+            kms_client = config.get_aws_client("kms")
+            response = kms_client.generate_data_key(
+                KeyId=kms_key,
+                KeySpec="AES_256"
+            )
+            config_file_contents = envelope.seal(
+                config_file_contents, response["Plaintext"], response["CiphertextBlob"])
+        elif config.encrypted:
             kms_client = config.get_aws_client("kms")
             response = kms_client.encrypt(
                 KeyId=kms_key,
@@ -125,7 +449,7 @@ class S3Config(BaseConfig):
 
         s3_client.put_object(
             Bucket=config.get_s3_bucket(),
-            Key=config.get_s3_path(section_name),
+            Key=key,
             Body=config_file_contents
         )
 
@@ -142,6 +466,7 @@ if __name__ == "__main__":
     ap.add_argument("-s", "--section", dest="section_name")
     ap.add_argument("-C", "--config-class", dest="config")
     ap.add_argument("-K", "--kms-key", dest="kms_key")
+    ap.add_argument("-E", "--envelope", dest="envelope_encryption", action="store_true", default=None)
     ap.add_argument("source_file")
     args = ap.parse_args()
 
@@ -149,6 +474,11 @@ if __name__ == "__main__":
     config_module = importlib.import_module(".".join(config_parts[:-1]))
     config = getattr(config_module, config_parts[-1])()
 
+    extension = os.path.splitext(args.source_file)[1]
+    if extension not in config.section_extensions:
+        extension = None
+
     with open(args.source_file, "rb") as f:
         config_file_contents = f.read()
-    save_config(config_file_contents, args.section_name, config=config, kms_key=args.kms_key)
+    save_config(config_file_contents, args.section_name, config=config, kms_key=args.kms_key,
+                envelope_encryption=args.envelope_encryption, extension=extension)
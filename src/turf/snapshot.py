@@ -0,0 +1,69 @@
+"""Persists loaded configuration to a local file so new processes start quickly.
+
+A snapshot holds every section's parsed source and validated result along
+with what they were derived from: the source's signature (file stat or S3
+ETag) and content digest, the section's schema and defaults hashes, and the
+turf version.  A new process loads it with one read and then only has to
+confirm each source is unchanged, rather than parsing and validating it.
+
+Snapshots are pickled, so the snapshot file must only be writable by the
+user running the application.  Files owned by another user or writable by
+others are ignored.
+"""
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+
+
+def turf_version():
+    """Returns the installed version of turf, or "unknown"."""
+    try:
+        from importlib.metadata import version
+        return version("turf")
+    except Exception:  # pylint: disable=broad-except
+        return "unknown"
+
+
+def file_digest(path):
+    """Returns the SHA-256 digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as file_handle:
+        for chunk in iter(lambda: file_handle.read(65536), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_snapshot(path):
+    """Returns the snapshot stored at ``path``, or None if it is missing, unsafe or unreadable."""
+    try:
+        with open(path, "rb") as snapshot_file:
+            snapshot_stat = os.fstat(snapshot_file.fileno())
+            if hasattr(os, "getuid") and (
+                    snapshot_stat.st_uid != os.getuid() or snapshot_stat.st_mode & 0o022):
+                logger.warning("Ignoring config snapshot %s: it is writable by other users", path)
+                return None
+            return pickle.load(snapshot_file)
+    except FileNotFoundError:
+        return None
+    except Exception:  # pylint: disable=broad-except
+        logger.warning("Ignoring unreadable config snapshot %s", path, exc_info=True)
+        return None
+
+
+def write_snapshot(path, snapshot):
+    """Atomically replaces the snapshot at ``path``, readable only by the current user."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".turf-snapshot-")
+    try:
+        with os.fdopen(fd, "wb") as snapshot_file:
+            pickle.dump(snapshot, snapshot_file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
@@ -0,0 +1,121 @@
+"""Keeps per-section refresh statistics and exports them for monitoring.
+
+See :meth:`turf.config.BaseConfig.get_stats` and
+:meth:`turf.config.BaseConfig.get_prometheus_stats`.
+"""
+import time
+
+VALIDATION_STAGES = ("validate_defaults", "validate_prehook", "validate", "validate_final")
+
+# (name, type, help, key in SectionStats.as_dict)
+PROMETHEUS_METRICS = (
+    ("section_loads_total", "counter", "Times the section was loaded", "loads"),
+    ("section_unchanged_total", "counter",
+     "Loads that reused the previous value because the source was unchanged", "unchanged"),
+    ("section_cache_hits_total", "counter", "Accesses served without reloading", "cache_hits"),
+    ("section_stale_hits_total", "counter",
+     "Expired values served while reloading in the background", "stale_hits"),
+    ("section_errors_total", "counter", "Loads that raised an error", "errors"),
+    ("section_consecutive_errors", "gauge", "Loads that failed since the last success",
+     "consecutive_errors"),
+    ("section_degraded", "gauge",
+     "1 if the last load failed and the previous value is being served", "degraded"),
+    ("section_bytes_read_total", "counter", "Bytes read from the section's source", "bytes_read"),
+    ("section_parse_seconds_total", "counter", "Time spent parsing", "parse_seconds"),
+    ("section_validation_seconds_total", "counter", "Time spent validating", "validation_seconds"),
+    ("section_last_load_seconds", "gauge", "Duration of the most recent load", "last_load_seconds"),
+    ("section_age_seconds", "gauge", "Seconds since the current value was loaded", "age_seconds"),
+    ("section_last_error_timestamp_seconds", "gauge",
+     "Unix time of the most recent error", "last_error_time"),
+)
+
+
+class SectionStats(object):
+    """Counters for one section.
+
+    They are updated without locking, so counts from concurrent loads of
+    the same section may occasionally be missed.
+    """
+
+    def __init__(self):
+        self.loads = 0
+        self.unchanged = 0
+        self.cache_hits = 0
+        self.stale_hits = 0
+        self.errors = 0
+        self.consecutive_errors = 0
+        self.degraded = False
+        self.bytes_read = 0
+        self.parse_seconds = 0.0
+        self.validation_seconds = 0.0
+        self.last_load_seconds = None
+        self.loaded_at = None
+        self.last_error = None
+        self.last_error_time = None
+
+    def record_load(self, timer, unchanged=False):
+        """Adds a completed load, timed by a :class:`turf.config.StageTimer`."""
+        timings = timer.timings
+        self.loads += 1
+        if unchanged:
+            self.unchanged += 1
+        self.parse_seconds += timings.get("parse", 0.0)
+        self.validation_seconds += sum(timings.get(stage, 0.0) for stage in VALIDATION_STAGES)
+        self.last_load_seconds = timer.elapsed()
+        self.loaded_at = time.monotonic()
+        self.consecutive_errors = 0
+        self.degraded = False
+
+    def record_error(self, error):
+        self.errors += 1
+        self.consecutive_errors += 1
+        self.last_error = error
+        self.last_error_time = time.time()
+
+    def as_dict(self):
+        """Returns the statistics as a dictionary of plain values."""
+        return {
+            "loads": self.loads,
+            "unchanged": self.unchanged,
+            "cache_hits": self.cache_hits,
+            "stale_hits": self.stale_hits,
+            "errors": self.errors,
+            "consecutive_errors": self.consecutive_errors,
+            "degraded": self.degraded,
+            "bytes_read": self.bytes_read,
+            "parse_seconds": self.parse_seconds,
+            "validation_seconds": self.validation_seconds,
+            "last_load_seconds": self.last_load_seconds,
+            "age_seconds": None if self.loaded_at is None else time.monotonic() - self.loaded_at,
+            "last_error": None if self.last_error is None else repr(self.last_error),
+            "last_error_time": self.last_error_time,
+        }
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def to_prometheus(stats, prefix="turf", labels=None):
+    """Formats the result of ``get_stats()`` in the Prometheus text exposition format.
+
+    :param dict labels: Extra labels added to every sample, such as
+        ``{"config": "app"}``.
+    """
+    extra_labels = "".join(",{0}=\"{1}\"".format(name, _escape_label(value))
+                           for name, value in sorted((labels or {}).items()))
+    lines = []
+    for name, metric_type, description, key in PROMETHEUS_METRICS:
+        metric = "{0}_{1}".format(prefix, name)
+        lines.append("# HELP {0} {1}".format(metric, description))
+        lines.append("# TYPE {0} {1}".format(metric, metric_type))
+        for section_name in sorted(stats):
+            value = stats[section_name][key]
+            if value is None:
+                continue
+            if isinstance(value, bool):
+                value = int(value)
+            lines.append("{0}{{section=\"{1}\"{2}}} {3}".format(
+                metric, _escape_label(section_name), extra_labels, repr(float(value))
+                if isinstance(value, float) else value))
+    return "\n".join(lines) + "\n"
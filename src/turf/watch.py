@@ -0,0 +1,239 @@
+"""Watches configuration directories so changed sections can be reloaded on demand.
+
+:class:`InotifyWatcher` is used on Linux, with :class:`PollingWatcher`
+as a fallback wherever inotify is not available.
+"""
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+# Atomic-rename writers show up as IN_MOVED_TO, in-place writers as IN_CLOSE_WRITE
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+              IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+def _load_libc():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+_libc = _load_libc()
+
+
+def inotify_available():
+    return _libc is not None
+
+
+class BaseWatcher(object):
+    """Runs a daemon thread that reports changed files in a set of directories.
+
+    :param directories: Directories to watch.  Files are reported as
+        ``os.path.join(directory, name)``.
+
+    :param callback: Called with a set of changed paths, or with ``None`` if
+        the watcher lost track of changes and everything should be reloaded.
+        Changes are coalesced, so a burst of writes results in one call.
+
+    :param float debounce_seconds: How long to wait for further changes
+        before calling ``callback``.
+    """
+
+    def __init__(self, directories, callback, debounce_seconds=0.1):
+        self.directories = list(directories)
+        self.callback = callback
+        self.debounce_seconds = debounce_seconds
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="turf-watcher")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+    def notify(self, paths):
+        try:
+            self.callback(paths)
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Error handling changed config files")
+
+    def _run(self):
+        raise NotImplementedError
+
+
+class PollingWatcher(BaseWatcher):
+    """Detects changes by listing the watched directories every ``poll_seconds``."""
+
+    def __init__(self, directories, callback, debounce_seconds=0.1, poll_seconds=1.0):
+        super().__init__(directories, callback, debounce_seconds=debounce_seconds)
+        self.poll_seconds = poll_seconds
+
+    def scan(self):
+        signatures = {}
+        for directory in self.directories:
+            try:
+                entries = list(os.scandir(directory))
+            except OSError:
+                continue
+            for entry in entries:
+                try:
+                    entry_stat = entry.stat()
+                except OSError:
+                    continue
+                signatures[os.path.join(directory, entry.name)] = (
+                    entry_stat.st_mtime_ns, entry_stat.st_size, entry_stat.st_ino)
+        return signatures
+
+    def start(self):
+        self._previous = self.scan()
+        super().start()
+
+    def _run(self):
+        while not self._stop.wait(self.poll_seconds):
+            current = self.scan()
+            previous = self._previous
+            changed = set(path for path in set(previous) | set(current)
+                          if previous.get(path) != current.get(path))
+            self._previous = current
+            if changed:
+                self.notify(changed)
+
+
+class InotifyWatcher(BaseWatcher):
+    """Receives change notices from the kernel using inotify.
+
+    The directories are watched rather than the files themselves so that
+    files replaced by an atomic rename keep being tracked.
+    """
+
+    def __init__(self, directories, callback, debounce_seconds=0.1):
+        if _libc is None:
+            raise OSError("inotify is not available")
+        super().__init__(directories, callback, debounce_seconds=debounce_seconds)
+        self._fd = _libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._wake_read, self._wake_write = os.pipe()
+        self._closed = False
+        self._watches = {}
+        try:
+            for directory in self.directories:
+                wd = _libc.inotify_add_watch(self._fd, os.fsencode(directory), WATCH_MASK)
+                if wd < 0:
+                    raise OSError(ctypes.get_errno(), "inotify_add_watch failed", directory)
+                self._watches[wd] = directory
+        except OSError:
+            self._close()
+            raise
+
+    def stop(self):
+        if self._closed:
+            return
+        self._stop.set()
+        os.write(self._wake_write, b"x")
+        super().stop()
+        self._close()
+
+    def _close(self):
+        self._closed = True
+        for fd in (self._fd, self._wake_read, self._wake_write):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+    def _read_events(self, changed):
+        """Adds the paths named by pending events to ``changed``.
+
+        Returns False if the event queue overflowed.
+        """
+        try:
+            buf = os.read(self._fd, 65536)
+        except BlockingIOError:
+            return True
+        offset = 0
+        while offset < len(buf):
+            wd, mask, _, name_length = _EVENT_HEADER.unpack_from(buf, offset)
+            offset += _EVENT_HEADER.size
+            name = buf[offset:offset + name_length].rstrip(b"\0")
+            offset += name_length
+            if mask & IN_Q_OVERFLOW:
+                return False
+            if mask & IN_IGNORED:
+                continue
+            directory = self._watches.get(wd)
+            if directory is None:
+                continue
+            if name:
+                changed.add(os.path.join(directory, os.fsdecode(name)))
+            else:
+                # The directory itself was moved or deleted
+                return False
+        return True
+
+    def _run(self):
+        while not self._stop.is_set():
+            readable, _, _ = select.select([self._fd, self._wake_read], [], [])
+            if self._stop.is_set():
+                break
+            if self._fd not in readable:
+                continue
+            changed = set()
+            complete = self._read_events(changed)
+            deadline = time.monotonic() + self.debounce_seconds
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                readable, _, _ = select.select([self._fd, self._wake_read], [], [], remaining)
+                if self._stop.is_set():
+                    return
+                if self._fd in readable:
+                    complete = self._read_events(changed) and complete
+            if not complete:
+                self.notify(None)
+            elif changed:
+                self.notify(changed)
+
+
+def create_watcher(directories, callback, debounce_seconds=0.1, poll_seconds=1.0):
+    """Returns an unstarted watcher, preferring inotify and falling back to polling."""
+    if inotify_available():
+        try:
+            return InotifyWatcher(directories, callback, debounce_seconds=debounce_seconds)
+        except OSError as inotify_error:
+            logger.warning("Falling back to polling for config changes: %s", inotify_error)
+    return PollingWatcher(directories, callback, debounce_seconds=debounce_seconds,
+                          poll_seconds=poll_seconds)
@@ -0,0 +1,24 @@
+"""Provides YAML loading that uses libyaml's C parser whenever PyYAML was built with it"""
+import yaml
+
+SafeLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+Loader = getattr(yaml, "CLoader", yaml.Loader)
+
+HAS_LIBYAML = SafeLoader is not yaml.SafeLoader
+
+
+def safe_load(stream):
+    """Like :func:`yaml.safe_load`, using ``CSafeLoader`` when available."""
+    return yaml.load(stream, Loader=SafeLoader)
+
+
+def unsafe_load(stream):
+    """Loads YAML allowing arbitrary Python tags, using ``CLoader`` when available."""
+    return yaml.load(stream, Loader=Loader)
+
+
+def load(stream, safe=True):
+    """Loads YAML with :func:`safe_load`, or :func:`unsafe_load` if ``safe`` is False."""
+    if safe:
+        return safe_load(stream)
+    return unsafe_load(stream)
@@ -0,0 +1,99 @@
+import asyncio
+import threading
+from unittest import TestCase, mock
+
+from turf.aio import AsyncConfig, AsyncS3Config
+from turf.errors import SchemaNotFoundError, ValidationError
+
+
+class Config(AsyncConfig):
+    schema = {
+        "first": {"key": {"type": "string"}},
+        "second": {"key": {"type": "string"}}
+    }
+
+
+class TestAsyncConfig(TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+
+    def run_async(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+    def test_create_and_aget(self):
+        with mock.patch.object(Config, "read_section_from_file",
+                               side_effect=lambda section_name: {"key": section_name}):
+            config = self.run_async(Config.create(refresh_seconds=None))
+            self.assertEqual(self.run_async(config.aget("first")), {"key": "first"})
+        self.assertRaises(SchemaNotFoundError, self.run_async, config.aget("missing"))
+
+    def test_aget_reloads_expired_section_once(self):
+        with mock.patch.object(Config, "refresh"):
+            config = Config()
+        read_threads = set()
+
+        def read(section_name):
+            read_threads.add(threading.current_thread())
+            return {"key": section_name}
+
+        async def get_concurrently():
+            return await asyncio.gather(*[config.aget("first") for _ in range(5)])
+
+        with mock.patch.object(config, "read_section_from_file", side_effect=read) as read_patch:
+            results = self.run_async(get_concurrently())
+        self.assertEqual(results, [{"key": "first"}] * 5)
+        read_patch.assert_called_once_with("first")
+        self.assertNotIn(threading.current_thread(), read_threads)
+
+    def test_arefresh_raises_section_errors(self):
+        with mock.patch.object(Config, "refresh"):
+            config = Config()
+
+        def read(section_name):
+            if section_name == "first":
+                return {"key": 1}
+            return {"key": section_name}
+
+        with mock.patch.object(config, "read_section_from_file", side_effect=read):
+            with self.assertRaises(ValidationError) as raised:
+                self.run_async(config.arefresh())
+        self.assertEqual(raised.exception.section, "first")
+        self.assertEqual(config.data["second"], {"key": "second"})
+
+    def test_arefresh_raises_when_last_good_value_is_kept(self):
+        with mock.patch.object(Config, "read_section_from_file",
+                               side_effect=lambda section_name: {"key": section_name}):
+            config = Config(refresh_seconds=None)
+        with mock.patch.object(config, "read_section_from_file", return_value={"key": 1}):
+            with self.assertRaises(ValidationError):
+                self.run_async(config.arefresh())
+            self.run_async(config.arefresh(raise_errors=False))
+            config.invalidate_section("first")
+            self.assertEqual(self.run_async(config.aget("first")), {"key": "first"})
+        self.assertTrue(config.is_section_degraded("first"))
+
+    def test_arefresh_drops_removed_sections_and_saves_snapshot(self):
+        with mock.patch.object(Config, "read_section_from_file",
+                               side_effect=lambda section_name: {"key": section_name}):
+            config = Config(refresh_seconds=None)
+            config.data = dict(config.data, removed={"key": "removed"})
+            with mock.patch.object(config, "get_snapshot_path", return_value="snapshot.bin"):
+                with mock.patch.object(config, "save_snapshot") as save_patch:
+                    self.run_async(config.arefresh())
+        self.assertEqual(set(config.data), {"first", "second"})
+        save_patch.assert_called_once_with()
+
+    def test_async_s3_config_lists_once(self):
+        class S3Config(AsyncS3Config):
+            config_dir = "bucket"
+            list_sections = True
+            schema = Config.schema
+
+        with mock.patch.object(S3Config, "refresh"):
+            config = S3Config()
+        with mock.patch.object(config, "list_section_objects") as list_patch:
+            with mock.patch.object(config, "read_section_from_file", return_value={}):
+                self.run_async(config.arefresh())
+        list_patch.assert_called_once_with()
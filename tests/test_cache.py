@@ -0,0 +1,40 @@
+from unittest import TestCase
+
+from turf.cache import TTLCache
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTTLCache(TestCase):
+
+    def test_evicts_least_recently_used(self):
+        cache = TTLCache(2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        cache.set("c", 3)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("c"), 3)
+        self.assertEqual(len(cache), 2)
+
+    def test_entries_expire(self):
+        clock = FakeClock()
+        cache = TTLCache(2, ttl=10, clock=clock)
+        cache.set("a", 1)
+        clock.now = 9
+        self.assertEqual(cache.get("a"), 1)
+        clock.now = 10
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_zero_size_disables_cache(self):
+        cache = TTLCache(0)
+        cache.set("a", 1)
+        self.assertIsNone(cache.get("a"))
@@ -1,7 +1,11 @@
 # flake8: noqa
 from io import StringIO
+import operator
 import os
 import random
+import shutil
+import tempfile
+import threading
 import time
 from unittest import mock, TestCase
 import uuid
@@ -9,8 +13,10 @@ import uuid
 from nose2.tools import params
 from nose2.tools.such import helper as assert_helper
 
+import turf.config
 from turf.config import BaseConfig
-from turf.errors import ValidationError, SectionNotFoundError
+from turf.errors import ValidationError, SchemaNotFoundError, SectionNotFoundError
+from turf.policies import MaxStaleness, Never, TTL
 
 def random_settings_dict():
     return {uuid.uuid4().hex:uuid.uuid4().hex for x in range(0,random.randrange(5,10))}
@@ -18,6 +24,15 @@ def random_settings_dict():
 def random_settings_many():
     return [random_settings_dict() for x in range(0,6)]
 
+def wait_for_background_refreshes(config):
+    deadline = time.time() + 2
+    while config._background_refreshes and time.time() < deadline:
+        time.sleep(0.01)
+
+def age_section(config, section_name, seconds):
+    config._refresh_deadlines[section_name] -= seconds
+    config._stale_deadlines[section_name] -= seconds
+
 class TestConfig(TestCase):
 
     def tearDown(self):
@@ -150,15 +165,13 @@ class TestConfig(TestCase):
 
         with mock.patch("turf.config.BaseConfig.config_dir", new=mock.PropertyMock(
                 return_value = fake_config_dir)) as config_dir_patch:
-            with mock.patch("yaml.safe_load") as patch_yaml:
+            with mock.patch("turf.yaml_util.safe_load") as patch_yaml:
                 patch_yaml.return_value = {fake_key:fake_val}
 
                 with mock.patch("builtins.open") as patch_open:
                     patch_open.return_value = StringIO(fake_yml)
 
-                    with mock.patch("os.path.exists") as exists_patch:
-                        exists_patch.return_value = True
-
+                    with mock.patch("os.stat") as stat_patch:
                         section_config = BaseConfig().read_section_from_file(section_name)
                         assert section_config == {fake_key:fake_val}
                         patch_open.assert_called_once_with(config_path)
@@ -172,3 +185,441 @@ class TestConfig(TestCase):
         with mock.patch("turf.config.BaseConfig.config_dir", new=mock.PropertyMock(
                 return_value = fake_config_dir)) as config_dir_patch:
             assert BaseConfig().get_file_path_for_section(section_name) == config_path
+
+    @mock.patch("turf.config.BaseConfig.read_section_from_file")
+    def test_load_section_caches_validator(self, read_section_patch):
+        read_section_patch.return_value = {}
+        section_name = uuid.uuid4().hex
+        fake_schema = {uuid.uuid4().hex:{"type":"string"}}
+        config = BaseConfig()
+        with mock.patch.object(config, "get_validator", wraps=config.get_validator) as validator_patch:
+            config.load_section(section_name, {}, fake_schema)
+            config.load_section(section_name, {}, fake_schema)
+            validator_patch.assert_called_once_with(fake_schema)
+        assert config.validator_cache_misses == 1
+        assert config.validator_cache_hits == 1
+
+    @mock.patch("turf.config.BaseConfig.read_section_from_file")
+    def test_load_section_validator_cache_invalidated(self, read_section_patch):
+        read_section_patch.return_value = {}
+        section_name = uuid.uuid4().hex
+        fake_key = uuid.uuid4().hex
+        config = BaseConfig()
+        config.load_section(section_name, {fake_key:"a"}, {fake_key:{"type":"string"}})
+        assert_helper.assertRaises(
+                ValidationError, config.load_section,
+                section_name, {fake_key:"a"}, {fake_key:{"type":"integer"}})
+        assert config.validator_cache_misses == 2
+
+    @mock.patch("turf.config.BaseConfig.read_section_from_file")
+    def test_load_section_validates_defaults_once(self, read_section_patch):
+        read_section_patch.side_effect = lambda section_name: {}
+        section_name = uuid.uuid4().hex
+        fake_key = uuid.uuid4().hex
+        fake_schema = {fake_key:{"type":"string"}}
+        config = BaseConfig()
+        validator = config.get_section_validator(section_name, fake_schema)
+        with mock.patch.object(validator, "validate", wraps=validator.validate) as validate_patch:
+            config.load_section(section_name, {fake_key:"a"}, fake_schema)
+            assert validate_patch.call_count == 2
+            config.load_section(section_name, {fake_key:"a"}, fake_schema)
+            assert validate_patch.call_count == 3
+            config.load_section(section_name, {fake_key:"b"}, fake_schema)
+            assert validate_patch.call_count == 5
+
+    @mock.patch("turf.config.BaseConfig.read_section_from_file")
+    def test_load_section_records_stage_timings(self, read_section_patch):
+        read_section_patch.return_value = {}
+        section_name = uuid.uuid4().hex
+        fake_key = uuid.uuid4().hex
+        fake_hook = mock.MagicMock(return_value = {fake_key:"a"})
+        with mock.patch("turf.config.BaseConfig.posthooks", new=mock.PropertyMock(
+                return_value={section_name:fake_hook})) as posthooks_patch:
+            config = BaseConfig()
+            config.load_section(section_name, {}, {fake_key:{"type":"string"}})
+        assert list(config.section_timings[section_name]) == [
+            "validate_defaults", "read", "merge", "validate", "posthook", "validate_final"]
+
+    def test_read_section_skips_unchanged_file(self):
+        config_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, config_dir)
+        section_name = uuid.uuid4().hex
+        fake_key = uuid.uuid4().hex
+        config_path = os.path.join(config_dir, "{0}.yml".format(section_name))
+        with open(config_path, "w") as config_file:
+            config_file.write("{0}: first".format(fake_key))
+
+        class Config(BaseConfig):
+            schema = {section_name:{fake_key:{"type":"string"}}}
+
+        config = Config(config_dir=config_dir)
+        first = config[section_name]
+        with mock.patch.object(config, "yaml_load", wraps=config.yaml_load) as yaml_patch:
+            config.refresh()
+            assert config[section_name] == first
+            assert not yaml_patch.called
+
+            with open(config_path, "w") as config_file:
+                config_file.write("{0}: second!".format(fake_key))
+            config.refresh()
+            assert config[section_name] == {fake_key:"second!"}
+            yaml_patch.assert_called_once_with(config_path)
+
+    def test_stale_while_revalidate_serves_stale_value(self):
+        class Config(BaseConfig):
+            schema = {"section":{"key":{"type":"string"}}}
+
+        reading = threading.Event()
+        release = threading.Event()
+        values = iter(["first", "second"])
+
+        def read(section_name):
+            value = next(values)
+            if value == "second":
+                reading.set()
+                release.wait(2)
+            return {"key":value}
+
+        with mock.patch.object(Config, "read_section_from_file", side_effect=read):
+            config = Config(stale_while_revalidate=True)
+            age_section(config, "section", 120)
+            assert config["section"] == {"key":"first"}
+            assert reading.wait(2)
+            assert config["section"] == {"key":"first"}
+            release.set()
+            wait_for_background_refreshes(config)
+            assert config["section"] == {"key":"second"}
+
+    def test_stale_while_revalidate_keeps_value_on_error(self):
+        class Config(BaseConfig):
+            schema = {"section":{"key":{"type":"string"}}}
+
+        with mock.patch.object(Config, "read_section_from_file", return_value={"key":"first"}):
+            config = Config(stale_while_revalidate=True)
+        age_section(config, "section", 120)
+        with mock.patch.object(config, "read_section_from_file", side_effect=IOError("down")):
+            assert config["section"] == {"key":"first"}
+            wait_for_background_refreshes(config)
+        assert config["section"] == {"key":"first"}
+        assert isinstance(config.refresh_errors["section"], IOError)
+
+    def test_stale_while_revalidate_max_staleness(self):
+        class Config(BaseConfig):
+            schema = {"section":{"key":{"type":"string"}}}
+            max_staleness_seconds = 100
+
+        with mock.patch.object(Config, "read_section_from_file", return_value={"key":"first"}):
+            config = Config(stale_while_revalidate=True)
+        age_section(config, "section", 120)
+        with mock.patch.object(config, "read_section_from_file", return_value={"key":"second"}):
+            assert config["section"] == {"key":"second"}
+        assert config._background_executor is None
+
+    def test_background_refresh_after_fork(self):
+        class Config(BaseConfig):
+            schema = {"section":{"key":{"type":"string"}}}
+
+        with mock.patch.object(Config, "read_section_from_file", return_value={"key":"first"}):
+            config = Config(stale_while_revalidate=True)
+        age_section(config, "section", 120)
+        # A reload running in the parent when it forked never finishes in the child
+        config._background_refreshes.add("section")
+        config.get_section_lock("section").acquire()
+        with mock.patch("turf.config.os.getpid", return_value=os.getpid() + 1):
+            with mock.patch.object(config, "read_section_from_file", return_value={"key":"second"}):
+                config["section"]
+                wait_for_background_refreshes(config)
+                assert config["section"] == {"key":"second"}
+
+    def test_locks_held_at_fork_are_replaced(self):
+        class Config(BaseConfig):
+            schema = {"section":{"key":{"type":"string"}}}
+
+        with mock.patch.object(Config, "read_section_from_file", return_value={"key":"first"}):
+            config = Config()
+        # Threads of the parent holding these locks do not exist in the child
+        config._lock.acquire()
+        config.get_section_lock("section").acquire()
+        turf.config._reset_configs_after_fork()
+        with mock.patch.object(config, "read_section_from_file", return_value={"key":"second"}):
+            reload_thread = threading.Thread(target=config.refresh)
+            reload_thread.start()
+            reload_thread.join(2)
+        assert not reload_thread.is_alive()
+        assert config["section"] == {"key":"second"}
+
+    def test_expired_section_reloaded_by_one_thread(self):
+        class Config(BaseConfig):
+            schema = {"section":{"key":{"type":"integer"}}}
+
+        loads = []
+
+        def read(section_name):
+            loads.append(threading.current_thread())
+            time.sleep(0.05)
+            return {"key":len(loads)}
+
+        def read_concurrently(config):
+            start = threading.Barrier(16, timeout=2)
+            results = []
+
+            def reader():
+                start.wait()
+                results.append(config["section"]["key"])
+
+            threads = [threading.Thread(target=reader) for _ in range(16)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            return results
+
+        with mock.patch.object(Config, "refresh"):
+            config = Config()
+        with mock.patch.object(config, "read_section_from_file", side_effect=read):
+            # Nothing loaded yet, so every thread waits for the one reload
+            assert read_concurrently(config) == [1] * 16
+            for attempt in range(2, 6):
+                config.invalidate_section("section")
+                # Threads that lose the race get the previous value
+                assert set(read_concurrently(config)) <= {attempt - 1, attempt}
+                assert len(loads) == attempt
+                assert config["section"]["key"] == attempt
+
+    def test_immutable_sections(self):
+        class Config(BaseConfig):
+            schema = {"section":{"key":{"type":"list"}}, "other":{"key":{"type":"list"}}}
+
+        with mock.patch.object(Config, "read_section_from_file", return_value={"key":[{"a":1}]}):
+            config = Config(immutable=True)
+            section = config["section"]
+            assert_helper.assertRaises(TypeError, operator.setitem, section, "key", [])
+            assert section["key"][0]["a"] == 1
+            assert isinstance(section["key"], tuple)
+            snapshot = config.snapshot()
+            config.refresh()
+            assert config["section"] is section
+            config.invalidate_section("other")
+            config["other"]
+            assert config.snapshot() is not snapshot
+            assert snapshot["section"] is section
+
+    def test_snapshot_restores_unchanged_sections(self):
+        config_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, config_dir)
+        snapshot_path = os.path.join(config_dir, "snapshot.bin")
+        config_path = os.path.join(config_dir, "section.yml")
+        with open(config_path, "w") as config_file:
+            config_file.write("key: value")
+
+        class Config(BaseConfig):
+            schema = {"section":{"key":{"type":"string"}}}
+
+        Config(config_dir=config_dir, snapshot_path=snapshot_path)
+        assert os.stat(snapshot_path).st_mode & 0o077 == 0
+
+        with mock.patch.object(Config, "yaml_load") as yaml_patch:
+            with mock.patch("cerberus.Validator.validate") as validate_patch:
+                config = Config(config_dir=config_dir, snapshot_path=snapshot_path)
+                assert config["section"] == {"key":"value"}
+                # A rewrite with identical content is matched by its digest
+                os.utime(config_path, ns=(0, 0))
+                config = Config(config_dir=config_dir, snapshot_path=snapshot_path)
+                assert config["section"] == {"key":"value"}
+            assert not yaml_patch.called
+            assert not validate_patch.called
+
+        changed_schema = {"section":{"key":{"type":"string", "empty":False}}}
+        with mock.patch.object(Config, "yaml_load") as yaml_patch:
+            with mock.patch("cerberus.Validator.validate", return_value=True) as validate_patch:
+                Config(config_dir=config_dir, snapshot_path=snapshot_path, schema=changed_schema)
+                assert validate_patch.called
+            assert not yaml_patch.called
+
+    def test_lazy_config_loads_sections_on_access(self):
+        class Config(BaseConfig):
+            schema = {"first":{"key":{"type":"string"}}, "second":{"key":{"type":"string"}}}
+
+        with mock.patch.object(Config, "read_section_from_file", return_value={"key":"value"}) as read_patch:
+            config = Config(lazy=True)
+            assert not read_patch.called
+            assert config["first"] == {"key":"value"}
+            read_patch.assert_called_once_with("first")
+            config.preload(["second"])
+            assert read_patch.call_count == 2
+            assert_helper.assertRaises(SchemaNotFoundError, config.preload, ["missing"])
+            config.preload()
+            assert read_patch.call_count == 4
+
+    def test_json_and_msgpack_sections(self):
+        class Config(BaseConfig):
+            section_extensions = (".json", ".msgpack", ".yml")
+            schema = {"first":{"key":{"type":"string"}}, "second":{"key":{"type":"string"}}}
+
+        config_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, config_dir)
+        with open(os.path.join(config_dir, "first.json"), "w") as json_file:
+            json_file.write('{"key": "from json"}')
+        with open(os.path.join(config_dir, "first.yml"), "w") as yaml_file:
+            yaml_file.write("key: from yaml")
+        with open(os.path.join(config_dir, "second.yml"), "w") as yaml_file:
+            yaml_file.write("key: from yaml")
+
+        config = Config(config_dir=config_dir)
+        assert config["first"] == {"key":"from json"}
+        assert config["second"] == {"key":"from yaml"}
+
+        try:
+            import msgpack
+        except ImportError:
+            return
+        with open(os.path.join(config_dir, "second.msgpack"), "wb") as msgpack_file:
+            msgpack_file.write(msgpack.packb({"key":"from msgpack"}))
+        config.invalidate_section("second")
+        assert config["second"] == {"key":"from msgpack"}
+
+    def test_timing_sinks_receive_stages(self):
+        class Config(BaseConfig):
+            schema = {"first":{"key":{"type":"string"}}}
+
+        config_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, config_dir)
+        with open(os.path.join(config_dir, "first.yml"), "w") as yaml_file:
+            yaml_file.write("key: value")
+
+        stages = []
+        config = Config(config_dir=config_dir, refresh_seconds=None,
+                        timing_sinks=[lambda section, stage, seconds: stages.append((section, stage))])
+        assert stages == [("first", "validate_defaults"), ("first", "read"), ("first", "parse"),
+                          ("first", "merge"), ("first", "validate")]
+
+        sink = mock.Mock()
+        config.add_timing_sink(sink)
+        config.invalidate_section("first")
+        config["first"]
+        section_name, timer = sink.record_section.call_args[0]
+        assert section_name == "first"
+        assert list(timer.timings) == ["read"]
+
+    def test_no_timing_sinks_emits_nothing(self):
+        with mock.patch.object(BaseConfig, "read_section_from_file", return_value={}):
+            with mock.patch("turf.instrumentation.emit") as emit_patch:
+                config = BaseConfig(schema={"first":{"key":{"type":"string"}}})
+        assert not emit_patch.called
+        assert "read" in config.section_timings["first"]
+
+    def test_stats(self):
+        class Config(BaseConfig):
+            schema = {"first":{"key":{"type":"string"}}}
+
+        config_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, config_dir)
+        with open(os.path.join(config_dir, "first.yml"), "w") as yaml_file:
+            yaml_file.write("key: value")
+
+        config = Config(config_dir=config_dir, refresh_seconds=None)
+        config["first"]
+        config.invalidate_section("first")
+        config["first"]
+        stats = config.get_stats()["first"]
+        assert stats["loads"] == 2
+        assert stats["unchanged"] == 1
+        assert stats["cache_hits"] == 1
+        assert stats["bytes_read"] == len("key: value")
+        assert stats["errors"] == 0
+
+        config.invalidate_section("first")
+        with mock.patch.object(Config, "read_section_from_file", return_value={"key": 1}):
+            assert config["first"] == {"key": "value"}
+        stats = config.get_stats()["first"]
+        assert stats["errors"] == 1
+        assert stats["degraded"]
+        assert stats["last_error"].startswith("ValidationError(")
+        assert 'turf_section_loads_total{section="first"} 2' in config.get_prometheus_stats()
+
+    def test_refresh_policies_per_section(self):
+        class Config(BaseConfig):
+            schema = {"topology":{"key":{"type":"string"}}, "flags":{"key":{"type":"string"}},
+                      "limits":{"key":{"type":"string"}}}
+            refresh_policies = {"topology": Never(), "flags": TTL(5), "limits": MaxStaleness(5, 60)}
+
+        now = [1000.0]
+        with mock.patch("time.monotonic", side_effect=lambda: now[0]):
+            with mock.patch.object(Config, "read_section_from_file", return_value={"key":"first"}):
+                config = Config(refresh_seconds=None)
+            with mock.patch.object(Config, "read_section_from_file", return_value={"key":"second"}) as read_patch:
+                # A wall clock jump does not expire anything
+                with mock.patch("time.time", return_value=0):
+                    assert config["flags"] == {"key":"first"}
+                assert not read_patch.called
+
+                now[0] += 10
+                assert config["topology"] == {"key":"first"}
+                assert config["flags"] == {"key":"second"}
+                with mock.patch.object(config, "refresh_section_in_background") as background_patch:
+                    assert config["limits"] == {"key":"first"}
+                    background_patch.assert_called_once_with("limits", Config.schema["limits"])
+
+                now[0] += 60
+                assert config["limits"] == {"key":"second"}
+                assert config["topology"] == {"key":"first"}
+
+    def test_failed_reload_keeps_last_good_value(self):
+        class Config(BaseConfig):
+            schema = {"section":{"key":{"type":"string"}}}
+            refresh_jitter = 0
+
+        now = [1000.0]
+        with mock.patch("time.monotonic", side_effect=lambda: now[0]):
+            with mock.patch.object(Config, "read_section_from_file", return_value={"key":"first"}):
+                config = Config(refresh_seconds=10)
+            now[0] += 20
+            with mock.patch.object(Config, "read_section_from_file", side_effect=IOError("down")) as read_patch:
+                assert config["section"] == {"key":"first"}
+                assert config.is_section_degraded("section")
+                assert isinstance(config.refresh_errors["section"], IOError)
+                # Retries are delayed rather than made on every access
+                assert config["section"] == {"key":"first"}
+                assert read_patch.call_count == 1
+                now[0] += config.retry_backoff_seconds
+                config["section"]
+                assert read_patch.call_count == 2
+                assert config.get_section_stats("section").consecutive_errors == 2
+            now[0] += config.retry_backoff_seconds * 2
+            with mock.patch.object(Config, "read_section_from_file", return_value={"key":"second"}):
+                assert config["section"] == {"key":"second"}
+            assert config.get_degraded_sections() == set()
+            assert "section" not in config.refresh_errors
+
+    def test_failed_first_load_raises(self):
+        class Config(BaseConfig):
+            schema = {"section":{"key":{"type":"string"}}}
+
+        with mock.patch.object(Config, "read_section_from_file", side_effect=IOError("down")):
+            assert_helper.assertRaises(IOError, Config)
+
+    def test_explicit_reloads_raise_errors(self):
+        class Config(BaseConfig):
+            schema = {"section":{"key":{"type":"string"}}}
+
+        with mock.patch.object(Config, "read_section_from_file", return_value={"key":"first"}):
+            config = Config(refresh_seconds=None)
+        with mock.patch.object(Config, "read_section_from_file", return_value={"key":1}):
+            assert_helper.assertRaises(ValidationError, config.refresh)
+            assert_helper.assertRaises(ValidationError, config.preload)
+            config.refresh(raise_errors=False)
+            config.invalidate_section("section")
+            assert config["section"] == {"key":"first"}
+        assert config.is_section_degraded("section")
+        assert config.get_section_stats("section").errors == 4
+
+    def test_refresh_deadlines_are_jittered(self):
+        class Config(BaseConfig):
+            schema = {"section":{"key":{"type":"string"}}}
+            refresh_jitter = 0.5
+
+        with mock.patch("time.monotonic", return_value=1000.0):
+            with mock.patch("random.random", return_value=1.0):
+                with mock.patch.object(Config, "read_section_from_file", return_value={"key":"first"}):
+                    config = Config(refresh_seconds=60)
+        assert config._refresh_deadlines["section"] == 1030.0
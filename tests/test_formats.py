@@ -0,0 +1,34 @@
+import unittest
+from unittest import mock
+
+from turf import formats
+
+
+class TestFormats(unittest.TestCase):
+
+    def test_get_format_by_extension(self):
+        self.assertIsInstance(formats.get_format("/etc/app/section.yml"), formats.YamlFormat)
+        self.assertIsInstance(formats.get_format("bucket/section.yaml"), formats.YamlFormat)
+        self.assertIsInstance(formats.get_format("section.json"), formats.JsonFormat)
+        self.assertIsInstance(formats.get_format("section.msgpack"), formats.MsgpackFormat)
+        self.assertRaises(ValueError, formats.get_format, "section.ini")
+
+    def test_yaml_format_respects_safe(self):
+        with mock.patch("turf.yaml_util.load", return_value={}) as load_patch:
+            formats.YamlFormat().loads(b"key: value", safe=False)
+            load_patch.assert_called_once_with(b"key: value", safe=False)
+
+    def test_json_format_accepts_bytes(self):
+        self.assertEqual(formats.JsonFormat().loads(b'{"key": "value"}'), {"key": "value"})
+        self.assertEqual(formats.JsonFormat().loads('{"key": 1}'), {"key": 1})
+
+    @unittest.skipIf(formats.msgpack is None, "msgpack is not installed")
+    def test_msgpack_format(self):
+        contents = formats.msgpack.packb({"key": ["value", 1]})
+        self.assertEqual(formats.MsgpackFormat().loads(contents), {"key": ["value", 1]})
+
+    def test_register_format(self):
+        custom_format = mock.Mock(spec=formats.SectionFormat)
+        formats.register_format(".custom", custom_format)
+        self.addCleanup(formats._formats.pop, ".custom")
+        self.assertIs(formats.get_format("section.custom"), custom_format)
@@ -0,0 +1,20 @@
+from types import MappingProxyType
+from unittest import TestCase
+
+from turf.frozen import freeze, thaw
+
+
+class TestFrozen(TestCase):
+
+    def test_freeze_nested_values(self):
+        frozen = freeze({"a": {"b": [1, {"c": {2}}]}})
+        self.assertIsInstance(frozen, MappingProxyType)
+        self.assertIsInstance(frozen["a"], MappingProxyType)
+        self.assertEqual(frozen["a"]["b"][0], 1)
+        self.assertEqual(frozen["a"]["b"][1]["c"], frozenset([2]))
+        with self.assertRaises(TypeError):
+            frozen["a"]["b"] = 1
+
+    def test_thaw_round_trip(self):
+        value = {"a": {"b": [1, {"c": {2}}]}}
+        self.assertEqual(thaw(freeze(value)), value)
@@ -0,0 +1,69 @@
+import logging
+import unittest
+from unittest import mock
+
+from turf import instrumentation
+from turf.config import StageTimer
+
+
+def make_timer():
+    timer = StageTimer()
+    timer.lap("read")
+    timer.lap("validate")
+    return timer
+
+
+class TestInstrumentation(unittest.TestCase):
+
+    def test_callback_sink(self):
+        callback = mock.Mock(spec=lambda section_name, stage, seconds: None)
+        timer = make_timer()
+        instrumentation.as_timing_sink(callback).record_section("section", timer)
+        callback.assert_has_calls([
+            mock.call("section", "read", timer.timings["read"]),
+            mock.call("section", "validate", timer.timings["validate"])])
+
+    def test_as_timing_sink_rejects_other_objects(self):
+        self.assertRaises(TypeError, instrumentation.as_timing_sink, object())
+
+    def test_statsd_sink(self):
+        client = mock.Mock()
+        timer = make_timer()
+        instrumentation.StatsdSink(client, prefix="app").record_section("section", timer)
+        client.timing.assert_any_call("app.section.read", timer.timings["read"] * 1e3)
+        self.assertEqual(client.timing.call_count, 2)
+
+    def test_logging_sink(self):
+        log = mock.Mock()
+        log.isEnabledFor.return_value = True
+        instrumentation.LoggingSink(log, level=logging.INFO).record_section("section", make_timer())
+        self.assertEqual(log.log.call_args[0][:3], (logging.INFO, "Loaded section %s: %s", "section"))
+
+    def test_span_sink(self):
+        tracer = mock.Mock()
+        timer = make_timer()
+        with mock.patch("turf.instrumentation.trace") as trace_patch:
+            instrumentation.SpanSink(tracer).record_section("section", timer)
+        self.assertEqual(tracer.start_span.call_args_list[0][0], ("turf.load_section",))
+        self.assertEqual([c[0][0] for c in tracer.start_span.call_args_list[1:]],
+                         ["turf.read", "turf.validate"])
+        self.assertEqual(tracer.start_span.call_args_list[1][1]["context"],
+                         trace_patch.set_span_in_context.return_value)
+        tracer.start_span.return_value.end.assert_called_with(
+            end_time=int(timer.started * 1e9) + int(timer.elapsed() * 1e9))
+
+    def test_emit_ignores_sink_errors(self):
+        failing = mock.Mock()
+        failing.record_section.side_effect = RuntimeError
+        working = mock.Mock()
+        instrumentation.emit([failing, working], "section", make_timer())
+        self.assertTrue(working.record_section.called)
+
+    def test_stage_timer_merge(self):
+        timer = StageTimer()
+        read_timer = StageTimer()
+        read_timer.lap("parse")
+        timer.lap("read")
+        timer.merge(read_timer)
+        self.assertEqual(list(timer.timings), ["read", "parse"])
+        self.assertGreaterEqual(timer.starts["parse"], 0)
@@ -0,0 +1,32 @@
+import math
+import unittest
+from unittest import mock
+
+from turf.policies import MaxStaleness, Never, OnChange, TTL
+
+
+class TestPolicies(unittest.TestCase):
+
+    def setUp(self):
+        self.config = mock.Mock(watch=False, max_staleness_seconds=None)
+
+    def test_never(self):
+        self.assertEqual(Never().get_refresh_deadline(self.config, 10.0), math.inf)
+
+    def test_ttl(self):
+        self.assertEqual(TTL(5).get_refresh_deadline(self.config, 10.0), 15.0)
+        self.assertEqual(TTL(5).get_stale_deadline(self.config, 10.0), math.inf)
+        self.config.max_staleness_seconds = 60
+        self.assertEqual(TTL(5).get_stale_deadline(self.config, 10.0), 70.0)
+
+    def test_on_change(self):
+        self.assertEqual(OnChange(30).get_refresh_deadline(self.config, 10.0), 40.0)
+        self.config.watch = True
+        self.assertEqual(OnChange(30).get_refresh_deadline(self.config, 10.0), math.inf)
+
+    def test_max_staleness(self):
+        policy = MaxStaleness(5, 60)
+        self.assertTrue(policy.stale_while_revalidate)
+        self.assertEqual(policy.get_refresh_deadline(self.config, 10.0), 15.0)
+        self.assertEqual(policy.get_stale_deadline(self.config, 10.0), 70.0)
+        self.assertEqual(MaxStaleness(5).get_stale_deadline(self.config, 10.0), math.inf)
@@ -0,0 +1,45 @@
+import unittest
+from unittest import mock
+
+from turf.errors import CircuitOpenError
+from turf.resilience import CircuitBreaker, backoff_delay, jitter_deadline
+
+
+class TestResilience(unittest.TestCase):
+
+    def test_backoff_delay(self):
+        with mock.patch("random.uniform", side_effect=lambda low, high: high):
+            self.assertEqual([backoff_delay(failures, 1.0, 10.0) for failures in range(1, 6)],
+                             [1.0, 2.0, 4.0, 8.0, 10.0])
+        self.assertTrue(2.0 <= backoff_delay(3, 1.0, 10.0) <= 4.0)
+
+    def test_jitter_deadline(self):
+        with mock.patch("random.random", return_value=0.5):
+            self.assertEqual(jitter_deadline(100.0, 200.0, 0.2), 190.0)
+        self.assertEqual(jitter_deadline(100.0, 200.0, 0), 200.0)
+        self.assertEqual(jitter_deadline(100.0, float("inf"), 0.2), float("inf"))
+
+    def test_circuit_breaker(self):
+        now = [0.0]
+        breaker = CircuitBreaker("s3", failure_threshold=2, reset_seconds=10)
+        with mock.patch("time.monotonic", side_effect=lambda: now[0]):
+            breaker.before_call()
+            breaker.record_failure()
+            breaker.before_call()
+            breaker.record_failure()
+            self.assertEqual(breaker.state, "open")
+            self.assertRaises(CircuitOpenError, breaker.before_call)
+
+            now[0] += 10
+            self.assertEqual(breaker.state, "half_open")
+            breaker.before_call()
+            # Only one trial call is let through
+            self.assertRaises(CircuitOpenError, breaker.before_call)
+            breaker.record_failure()
+            self.assertRaises(CircuitOpenError, breaker.before_call)
+
+            now[0] += 10
+            breaker.before_call()
+            breaker.record_success()
+            self.assertEqual(breaker.state, "closed")
+            breaker.before_call()
@@ -1,9 +1,16 @@
 import base64
+import os
+import shutil
+import tempfile
+import threading
 import unittest
-from unittest.mock import MagicMock, patch, sentinel, Mock
+from unittest.mock import ANY, MagicMock, patch, sentinel, Mock
 
+import botocore
 import yaml
-from turf.s3config import S3Config, save_config
+from turf import envelope
+from turf.errors import CircuitOpenError, ValidationError
+from turf.s3config import S3Config, save_config, _shared_clients
 
 class MyConfig(S3Config):
     config_dir = "{0}/{1}".format(sentinel.bucket, sentinel.path)
@@ -71,15 +78,38 @@ class TestS3Config(unittest.TestCase):
 
     def test_get_aws_client(self):    
         self.config.get_aws_client(sentinel.aws_service)
-        self.boto3_mock.assert_called_with(sentinel.aws_service)
-
-    @patch("yaml.safe_load", return_value=mock_config_dict)
+        self.boto3_mock.assert_called_with(sentinel.aws_service, config=ANY)
+
+    def test_get_aws_client_reuses_client(self):
+        first = self.config.get_aws_client("s3")
+        self.assertIs(self.config.get_aws_client("s3"), first)
+        self.assertEqual(self.boto3_mock.call_count, 1)
+        self.kms_config.get_aws_client("s3")
+        self.assertEqual(self.boto3_mock.call_count, 2)
+
+    def test_get_aws_client_recreated_after_fork(self):
+        self.config.get_aws_client("s3")
+        with patch("os.getpid", return_value=-1):
+            self.config.get_aws_client("s3")
+        self.assertEqual(self.boto3_mock.call_count, 2)
+
+    def test_get_aws_client_shared(self):
+        class SharedConfig(MyConfig):
+            share_aws_clients = True
+        _shared_clients.clear()
+        self.addCleanup(_shared_clients.clear)
+        with patch.object(SharedConfig, "refresh"):
+            first, second = SharedConfig(), SharedConfig()
+        self.assertIs(first.get_aws_client("kms"), second.get_aws_client("kms"))
+        self.assertEqual(self.boto3_mock.call_count, 1)
+
+    @patch("turf.yaml_util.safe_load", return_value=mock_config_dict)
     def test_s3config_calls_s3(self, yaml_mock):
         aws_mock = patch.object(self.config, "get_aws_client", return_value=MockAwsClient).start()
         result = self.config.read_section_from_file(sentinel.section)
         aws_mock.assert_called_with("s3")
 
-    @patch("yaml.safe_load", return_value=mock_config_dict)
+    @patch("turf.yaml_util.safe_load", return_value=mock_config_dict)
     def test_s3config_calls_get_object(self, yaml_mock):
         aws_mock = patch.object(self.config, "get_aws_client", return_value=MockAwsClient).start()
         result = self.config.read_section_from_file(sentinel.section)
@@ -88,41 +118,51 @@ class TestS3Config(unittest.TestCase):
             Key="{0}/{1}.yml".format(sentinel.path, sentinel.section)
         )
 
-    @patch("yaml.safe_load", return_value=mock_config_dict)
+    @patch("turf.yaml_util.safe_load", return_value=mock_config_dict)
     def test_s3config_reads_response(self, yaml_mock):
         aws_mock = patch.object(self.config, "get_aws_client", return_value=MockAwsClient).start()
         result = self.config.read_section_from_file(sentinel.section)
         mock_body = aws_mock.return_value.get_object.return_value
         mock_body["Body"].read.assert_called_with(sentinel.content_length)
 
-    @patch("yaml.safe_load", return_value=mock_config_dict)
+    @patch("turf.yaml_util.safe_load", return_value=mock_config_dict)
     def test_s3config_parses_yaml(self, yaml_mock):
         aws_mock = patch.object(self.config, "get_aws_client", return_value=MockAwsClient).start()
         result = self.config.read_section_from_file(sentinel.section)
         yaml_mock.assert_called_with(raw_yaml_body)
 
-    @patch("base64.b64decode", return_value=raw_yaml_body)
-    @patch("yaml.safe_load", return_value=mock_config_dict)
+    @patch("base64.b64decode", return_value=raw_yaml_body.encode())
+    @patch("turf.yaml_util.safe_load", return_value=mock_config_dict)
     def test_encrypted_s3config_calls_decrypt(self, yaml_mock, base64_mock):
         aws_mock = patch.object(self.kms_config, "get_aws_client", return_value=MockAwsClient).start()
         result = self.kms_config.read_section_from_file(str(sentinel.section))
         aws_mock.return_value.decrypt.assert_called_with(
-            CiphertextBlob=raw_yaml_body
+            CiphertextBlob=raw_yaml_body.encode()
         )
 
-    @patch("yaml.safe_load", return_value=mock_config_dict)
+    def test_kms_decrypt_caches_plaintext(self):
+        kms_client = MagicMock()
+        kms_client.decrypt.return_value = {"Plaintext": b"plaintext"}
+        patch.object(self.kms_config, "get_aws_client", return_value=kms_client).start()
+        self.assertEqual(self.kms_config.kms_decrypt(b"ciphertext"), b"plaintext")
+        self.assertEqual(self.kms_config.kms_decrypt(b"ciphertext"), b"plaintext")
+        kms_client.decrypt.assert_called_once_with(CiphertextBlob=b"ciphertext")
+        self.kms_config.kms_decrypt(b"other ciphertext")
+        self.assertEqual(kms_client.decrypt.call_count, 2)
+
+    @patch("turf.yaml_util.safe_load", return_value=mock_config_dict)
     def test_s3config_returns_config(self, yaml_mock):
         aws_mock = patch.object(self.config, "get_aws_client", return_value=MockAwsClient).start()
         result = self.config.read_section_from_file(str(sentinel.section))
         self.assertEqual(result, mock_config_dict)
 
-    @patch("yaml.safe_load", return_value=None)
+    @patch("turf.yaml_util.safe_load", return_value=None)
     def test_s3config_parse_failure_returns_empty_dict(self, yaml_mock):
         aws_mock = patch.object(self.config, "get_aws_client", return_value=MockAwsClient).start()
         result = self.config.read_section_from_file(str(sentinel.section))
         self.assertEqual(result, {})
 
-    @patch("yaml.safe_load", return_value={})
+    @patch("turf.yaml_util.safe_load", return_value={})
     def test_save_config_parses_config(self, yaml_mock):
         aws_mock = patch.object(self.config, "get_aws_client", return_value=MockAwsClient).start()
         result = save_config(raw_yaml_body, str(sentinel.section), config=self.config)
@@ -135,7 +175,7 @@ class TestS3Config(unittest.TestCase):
         self.config.get_validator.assert_called_with(self.config.schema[str(sentinel.section)])
         validator_mock.return_value.validate.assert_called_with(mock_config_dict)
 
-    @patch("yaml.safe_load", return_value=mock_config_dict)
+    @patch("turf.yaml_util.safe_load", return_value=mock_config_dict)
     def test_save_config_calls_encrypt(self, yaml_mock):
         aws_mock = patch.object(self.kms_config, "get_aws_client", return_value=MockAwsClient).start()
         result = save_config(raw_yaml_body, str(sentinel.section), kms_key=str(sentinel.kms_key), config=self.kms_config)
@@ -144,7 +184,7 @@ class TestS3Config(unittest.TestCase):
             Plaintext=raw_yaml_body
         )
 
-    @patch("yaml.safe_load", return_value=mock_config_dict)
+    @patch("turf.yaml_util.safe_load", return_value=mock_config_dict)
     def test_save_config_calls_put_object(self, yaml_mock):
         aws_mock = patch.object(self.config, "get_aws_client", return_value=MockAwsClient).start()
         result = save_config(raw_yaml_body, str(sentinel.section), config=self.config)
@@ -154,7 +194,7 @@ class TestS3Config(unittest.TestCase):
             Body=raw_yaml_body
         )
 
-    @patch("yaml.safe_load", return_value=mock_config_dict)
+    @patch("turf.yaml_util.safe_load", return_value=mock_config_dict)
     def test_save_config_saves_encrypted_config(self, yaml_mock):
         aws_mock = patch.object(self.kms_config, "get_aws_client", return_value=MockAwsClient).start()
         result = save_config(raw_yaml_body, str(sentinel.section), kms_key=str(sentinel.kms_key), config=self.kms_config)
@@ -171,3 +211,280 @@ class TestS3Config(unittest.TestCase):
         self.config.get_s3_path = Mock(return_value='file.yml')
         response = self.config.get_s3_path(str(sentinel.section))
         self.assertEqual('file.yml',response)
+
+    def test_s3config_sends_if_none_match_and_reuses_section(self):
+        not_modified = botocore.exceptions.ClientError(
+            {"Error": {"Code": "304", "Message": "Not Modified"},
+             "ResponseMetadata": {"HTTPStatusCode": 304}},
+            "GetObject")
+        s3_client = MagicMock()
+        s3_client.get_object.side_effect = [
+            {"Body": MockStreamingBody, "ContentLength": sentinel.content_length, "ETag": '"abc"'},
+            not_modified
+        ]
+        patch.object(self.config, "get_aws_client", return_value=s3_client).start()
+        section = str(sentinel.section)
+        first = self.config.read_section_from_file(section)
+        with patch("turf.yaml_util.safe_load") as yaml_mock:
+            second = self.config.read_section_from_file(section)
+            self.assertFalse(yaml_mock.called)
+        self.assertIs(first, second)
+        s3_client.get_object.assert_called_with(
+            Bucket=str(sentinel.bucket),
+            Key="{0}/{1}.yml".format(sentinel.path, sentinel.section),
+            IfNoneMatch='"abc"'
+        )
+
+    def test_s3config_not_modified_skips_validation(self):
+        section = str(sentinel.section)
+        not_modified = botocore.exceptions.ClientError(
+            {"Error": {"Code": "304", "Message": "Not Modified"}}, "GetObject")
+        s3_client = MagicMock()
+        s3_client.get_object.side_effect = [
+            {"Body": MockStreamingBody, "ContentLength": sentinel.content_length, "ETag": '"abc"'},
+            not_modified
+        ]
+        patch.object(self.config, "get_aws_client", return_value=s3_client).start()
+        self.config.refresh()
+        first = self.config[section]
+        validator = self.config.get_section_validator(section, self.config.schema[section])
+        with patch.object(validator, "validate") as validate_mock:
+            self.config.refresh()
+            self.assertFalse(validate_mock.called)
+        self.assertEqual(self.config[section], first)
+
+    def test_refresh_fetches_sections_concurrently(self):
+        class ManySectionConfig(S3Config):
+            config_dir = "bucket"
+            schema = {"section{0}".format(i): {"key": {"type": "string"}} for i in range(8)}
+
+        started = threading.Barrier(8, timeout=2)
+
+        def slow_read(section_name):
+            started.wait()
+            return {"key": section_name}
+
+        with patch.object(ManySectionConfig, "read_section_from_file", side_effect=slow_read):
+            config = ManySectionConfig()
+        self.assertEqual(config["section3"], {"key": "section3"})
+
+    def test_refresh_raises_first_section_error(self):
+        class ManySectionConfig(S3Config):
+            config_dir = "bucket"
+            schema = {"section{0}".format(i): {"key": {"type": "string"}} for i in range(4)}
+
+        def read(section_name):
+            if section_name in ("section1", "section2"):
+                return {"key": 1}
+            return {"key": section_name}
+
+        with patch.object(ManySectionConfig, "read_section_from_file", side_effect=read):
+            with patch.object(ManySectionConfig, "refresh"):
+                config = ManySectionConfig()
+            with self.assertRaises(ValidationError) as raised:
+                config.refresh()
+        self.assertEqual(raised.exception.section, "section1")
+        self.assertEqual(config.data["section3"], {"key": "section3"})
+
+    def test_listing_skips_get_for_missing_and_unchanged_sections(self):
+        class ListingConfig(MyConfig):
+            list_sections = True
+            schema = {"present": {str(sentinel.key): {"type": "string"}}, "absent": {}}
+
+        s3_client = MagicMock()
+        s3_client.get_paginator.return_value.paginate.return_value = [{
+            "Contents": [{"Key": "{0}/present.yml".format(sentinel.path), "ETag": '"abc"', "Size": 10}]
+        }]
+        s3_client.get_object.return_value = {
+            "Body": MockStreamingBody, "ContentLength": sentinel.content_length, "ETag": '"abc"'
+        }
+        with patch.object(ListingConfig, "get_aws_client", return_value=s3_client):
+            config = ListingConfig()
+            s3_client.get_paginator.return_value.paginate.assert_called_once_with(
+                Bucket=str(sentinel.bucket), Prefix="{0}/".format(sentinel.path))
+            s3_client.get_object.assert_called_once_with(
+                Bucket=str(sentinel.bucket), Key="{0}/present.yml".format(sentinel.path))
+            self.assertEqual(config["absent"], {})
+
+            config.refresh()
+            self.assertEqual(s3_client.get_paginator.return_value.paginate.call_count, 2)
+            self.assertEqual(s3_client.get_object.call_count, 1)
+
+            s3_client.get_paginator.return_value.paginate.return_value[0]["Contents"][0]["ETag"] = '"def"'
+            config.refresh()
+            self.assertEqual(s3_client.get_object.call_count, 2)
+
+    def test_json_section_found_by_listing(self):
+        class JsonConfig(MyConfig):
+            section_extensions = (".json", ".yml")
+
+        s3_client = MagicMock()
+        s3_client.get_paginator.return_value.paginate.return_value = [{
+            "Contents": [{"Key": "{0}/{1}.json".format(sentinel.path, sentinel.section),
+                          "ETag": '"abc"', "Size": 10}]
+        }]
+        body = Mock()
+        body.read.return_value = '{{"{0}": "from json"}}'.format(sentinel.key).encode("utf-8")
+        s3_client.get_object.return_value = {"Body": body, "ContentLength": 10, "ETag": '"abc"'}
+        with patch.object(JsonConfig, "get_aws_client", return_value=s3_client):
+            config = JsonConfig()
+            s3_client.get_object.assert_called_once_with(
+                Bucket=str(sentinel.bucket), Key="{0}/{1}.json".format(sentinel.path, sentinel.section))
+            self.assertEqual(config[str(sentinel.section)], {str(sentinel.key): "from json"})
+
+    @patch("base64.b64decode", return_value=raw_yaml_body.encode())
+    @patch("turf.yaml_util.safe_load", return_value=mock_config_dict)
+    def test_s3config_records_read_stages(self, yaml_mock, base64_mock):
+        patch.object(self.kms_config, "get_aws_client", return_value=MockAwsClient).start()
+        sink = Mock()
+        self.kms_config.add_timing_sink(sink)
+        self.kms_config.refresh()
+        section_name, timer = sink.record_section.call_args[0]
+        self.assertEqual(section_name, str(sentinel.section))
+        self.assertEqual(list(timer.timings)[:4], ["read", "s3_get", "kms_decrypt", "parse"])
+
+    def test_s3config_read_failure_raises(self):
+        s3_client = MagicMock()
+        s3_client.get_object.return_value = {"Body": MagicMock(), "ContentLength": 10}
+        s3_client.get_object.return_value["Body"].read.side_effect = IOError("reset")
+        patch.object(self.config, "get_aws_client", return_value=s3_client).start()
+        self.assertRaises(IOError, self.config.read_section_from_file, str(sentinel.section))
+
+    def test_s3_circuit_breaker_opens_on_server_errors(self):
+        class BreakerConfig(MyConfig):
+            circuit_failure_threshold = 2
+
+        s3_client = MagicMock()
+        with patch.object(BreakerConfig, "get_aws_client", return_value=s3_client):
+            s3_client.get_object.side_effect = botocore.exceptions.ClientError(
+                {"Error": {"Code": "NoSuchKey"}, "ResponseMetadata": {"HTTPStatusCode": 404}}, "GetObject")
+            config = BreakerConfig()
+            config.refresh()
+            config.refresh()
+            self.assertEqual(config.get_circuit_breaker("s3").state, "closed")
+
+            s3_client.get_object.side_effect = botocore.exceptions.ClientError(
+                {"Error": {"Code": "InternalError"}, "ResponseMetadata": {"HTTPStatusCode": 500}}, "GetObject")
+            for _ in range(2):
+                with self.assertRaises(botocore.exceptions.ClientError):
+                    config.refresh()
+            self.assertEqual(config.get_circuit_breaker("s3").state, "open")
+            calls = s3_client.get_object.call_count
+            with self.assertRaises(CircuitOpenError):
+                config.refresh()
+            self.assertEqual(s3_client.get_object.call_count, calls)
+            self.assertTrue(config.is_section_degraded(str(sentinel.section)))
+            self.assertIsInstance(config.refresh_errors[str(sentinel.section)], CircuitOpenError)
+
+    def test_expired_section_does_not_trust_previous_listing(self):
+        class ListingConfig(MyConfig):
+            list_sections = True
+
+        key = "{0}/{1}.yml".format(sentinel.path, sentinel.section)
+        s3_client = MagicMock()
+        s3_client.get_paginator.return_value.paginate.return_value = [{
+            "Contents": [{"Key": key, "ETag": '"abc"', "Size": 10}]
+        }]
+        s3_client.get_object.return_value = {
+            "Body": MockStreamingBody, "ContentLength": sentinel.content_length, "ETag": '"abc"'
+        }
+        with patch.object(ListingConfig, "get_aws_client", return_value=s3_client):
+            config = ListingConfig(refresh_seconds=60)
+            self.assertEqual(s3_client.get_object.call_count, 1)
+            # The object changes after the listing, and the section expires before the next one
+            s3_client.get_object.return_value = {
+                "Body": MockStreamingBody, "ContentLength": sentinel.content_length, "ETag": '"def"'
+            }
+            config.invalidate_section(str(sentinel.section))
+            config[str(sentinel.section)]
+            s3_client.get_object.assert_called_with(
+                Bucket=str(sentinel.bucket), Key=key, IfNoneMatch='"abc"')
+            self.assertEqual(s3_client.get_paginator.return_value.paginate.call_count, 1)
+
+    def test_listing_failure_marks_sections_degraded(self):
+        class ListingConfig(MyConfig):
+            list_sections = True
+
+        s3_client = MagicMock()
+        s3_client.get_paginator.return_value.paginate.return_value = [{
+            "Contents": [{"Key": "{0}/{1}.yml".format(sentinel.path, sentinel.section),
+                          "ETag": '"abc"', "Size": 10}]
+        }]
+        s3_client.get_object.return_value = {
+            "Body": MockStreamingBody, "ContentLength": sentinel.content_length, "ETag": '"abc"'
+        }
+        server_error = botocore.exceptions.ClientError(
+            {"Error": {"Code": "InternalError"}, "ResponseMetadata": {"HTTPStatusCode": 500}}, "ListObjectsV2")
+        with patch.object(ListingConfig, "get_aws_client", return_value=s3_client):
+            config = ListingConfig()
+            s3_client.get_paginator.return_value.paginate.side_effect = server_error
+            s3_client.get_object.side_effect = server_error
+            with self.assertLogs("turf.s3config", level="WARNING"):
+                config.refresh(raise_errors=False)
+            with self.assertRaises(botocore.exceptions.ClientError):
+                config.refresh()
+        self.assertEqual(config.get_degraded_sections(), {str(sentinel.section)})
+        self.assertIs(config.refresh_errors[str(sentinel.section)], server_error)
+        self.assertEqual(config[str(sentinel.section)], mock_config_dict)
+
+    @unittest.skipIf(envelope.AESGCM is None, "cryptography is not installed")
+    def test_envelope_save_and_read(self):
+        data_key = b"k" * 32
+        kms_client = MagicMock()
+        kms_client.generate_data_key.return_value = {
+            "Plaintext": data_key, "CiphertextBlob": b"wrapped key"}
+        kms_client.decrypt.return_value = {"Plaintext": data_key}
+        patch.object(self.kms_config, "get_aws_client", return_value=kms_client).start()
+        large_body = yaml.dump({str(sentinel.key): "x" * 8192})
+
+        body = save_config(large_body, str(sentinel.section), config=self.kms_config,
+                           kms_key=str(sentinel.kms_key), envelope_encryption=True)
+        kms_client.generate_data_key.assert_called_with(KeyId=str(sentinel.kms_key), KeySpec="AES_256")
+        self.assertFalse(kms_client.encrypt.called)
+        self.assertTrue(body.startswith(envelope.HEADER))
+
+        body_stream = MagicMock()
+        body_stream.read.return_value = body
+        kms_client.get_object.return_value = {"Body": body_stream, "ContentLength": len(body)}
+        result = self.kms_config.read_section_from_file(str(sentinel.section))
+        self.assertEqual(result, {str(sentinel.key): "x" * 8192})
+        kms_client.decrypt.assert_called_once_with(CiphertextBlob=b"wrapped key")
+        self.kms_config.read_section_from_file(str(sentinel.section))
+        self.assertEqual(kms_client.decrypt.call_count, 1)
+
+    @patch("base64.b64decode", return_value=raw_yaml_body.encode())
+    def test_encrypted_config_does_not_write_snapshot(self, base64_mock):
+        snapshot_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, snapshot_dir)
+        snapshot_path = os.path.join(snapshot_dir, "snapshot.bin")
+        s3_client = MagicMock()
+        s3_client.get_object.return_value = {
+            "Body": MockStreamingBody, "ContentLength": sentinel.content_length, "ETag": '"abc"'}
+        s3_client.decrypt.return_value = {"Plaintext": raw_yaml_body}
+        with patch.object(MyEncryptedConfig, "get_aws_client", return_value=s3_client):
+            with self.assertLogs("turf.config", level="WARNING"):
+                config = MyEncryptedConfig(snapshot_path=snapshot_path)
+            self.assertEqual(config[str(sentinel.section)], mock_config_dict)
+            config.refresh()
+        self.assertFalse(os.path.exists(snapshot_path))
+        self.assertEqual(os.listdir(snapshot_dir), [])
+
+    def test_snapshot_restores_etags(self):
+        snapshot_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, snapshot_dir)
+        snapshot_path = os.path.join(snapshot_dir, "snapshot.bin")
+        section = str(sentinel.section)
+        s3_client = MagicMock()
+        s3_client.get_object.return_value = {
+            "Body": MockStreamingBody, "ContentLength": sentinel.content_length, "ETag": '"abc"'}
+        with patch.object(MyConfig, "get_aws_client", return_value=s3_client):
+            MyConfig(snapshot_path=snapshot_path)
+            s3_client.get_object.side_effect = botocore.exceptions.ClientError(
+                {"Error": {"Code": "304", "Message": "Not Modified"}}, "GetObject")
+            config = MyConfig(snapshot_path=snapshot_path)
+        s3_client.get_object.assert_called_with(
+            Bucket=str(sentinel.bucket),
+            Key="{0}/{1}.yml".format(sentinel.path, sentinel.section),
+            IfNoneMatch='"abc"'
+        )
+        self.assertEqual(config[section], mock_config_dict)
@@ -1,11 +1,17 @@
 # flake8: noqa
 
 import os
+import shutil
+import tempfile
+import threading
 import uuid
 
+import yaml
+
 from unittest import mock, TestCase
 
 from turf.config import SingleFileConfig
+from turf.errors import ValidationError
 
 
 class TestConfig(TestCase):
@@ -33,43 +39,268 @@ class TestConfig(TestCase):
                                        config_file=fake_file_name)
                 assert sfc.get_file_path() == config_path
 
-    def test_single_file_config_refresh(self):
-        fake_config_dir = os.path.join("/tmp", uuid.uuid4().hex)
+    def write_config_file(self, fake_config):
+        fake_config_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, fake_config_dir)
         fake_file_name = "{0}.yml".format(uuid.uuid4().hex)
+        with open(os.path.join(fake_config_dir, fake_file_name), "w") as config_file:
+            yaml.safe_dump(fake_config, config_file)
+        return fake_config_dir, fake_file_name
 
+    def test_single_file_config_refresh(self):
         fake_section = uuid.uuid4().hex
         fake_key = uuid.uuid4().hex
         fake_val = uuid.uuid4().hex
         fake_config = {fake_section:{fake_key:fake_val}}
+        fake_config_dir, fake_file_name = self.write_config_file(fake_config)
 
         class Config(SingleFileConfig):
             schema = {fake_section:{fake_key:{"type":"string"}}}
 
-        with mock.patch("turf.config.SingleFileConfig.yaml_load") as patch_yaml:
-            with mock.patch("os.path.exists") as exists_patch:
-                patch_yaml.return_value = fake_config
-
-                sfc = Config(search_path=[fake_config_dir],
-                             config_file=fake_file_name)
-                assert fake_section in sfc
-
+        sfc = Config(search_path=[fake_config_dir],
+                     config_file=fake_file_name)
+        assert fake_section in sfc
 
     def test_single_file_config(self):
-        fake_config_dir = os.path.join("/tmp", uuid.uuid4().hex)
-        fake_file_name = "{0}.yml".format(uuid.uuid4().hex)
-
         fake_section = uuid.uuid4().hex
         fake_key = uuid.uuid4().hex
         fake_val = uuid.uuid4().hex
         fake_config = {fake_section:{fake_key:fake_val}}
+        fake_config_dir, fake_file_name = self.write_config_file(fake_config)
 
         class Config(SingleFileConfig):
             schema = {fake_section:{fake_key:{"type":"string"}}}
 
-        with mock.patch("turf.config.SingleFileConfig.yaml_load") as patch_yaml:
-            with mock.patch("os.path.exists") as exists_patch:
-                patch_yaml.return_value = fake_config
+        sfc = Config(search_path=[fake_config_dir],
+                     config_file=fake_file_name)
+        assert sfc.read_section_from_file(fake_section) == fake_config[fake_section]
+
+    def test_lazy_single_file_config(self):
+        fake_config_dir = os.path.join("/tmp", uuid.uuid4().hex)
+        fake_file_name = "{0}.yml".format(uuid.uuid4().hex)
+        fake_section = uuid.uuid4().hex
+        fake_config = {fake_section:{"key":"value"}}
+
+        class Config(SingleFileConfig):
+            schema = {fake_section:{"key":{"type":"string"}}}
+
+        with mock.patch("turf.config.SingleFileConfig.load_file") as patch_load:
+            patch_load.return_value = fake_config
+            sfc = Config(search_path=[fake_config_dir], config_file=fake_file_name, lazy=True)
+            assert not patch_load.called
+            assert sfc[fake_section] == {"key":"value"}
+            patch_load.assert_called_once_with()
+
+
+class TestIncrementalRefresh(TestCase):
+
+    def setUp(self):
+        self.config_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.config_dir)
+        self.path = os.path.join(self.config_dir, "config.yml")
+
+    def write(self, contents, mtime):
+        with open(self.path, "w") as config_file:
+            config_file.write(contents)
+        os.utime(self.path, (mtime, mtime))
+
+    def make_config(self, **kwargs):
+        class Config(SingleFileConfig):
+            schema = {"first":{"key":{"type":"string"}}, "second":{"key":{"type":"string"}}}
+
+        return Config(search_path=[self.config_dir], config_file="config.yml", **kwargs)
+
+    def test_unchanged_file_is_not_parsed_again(self):
+        self.write("first: {key: a}\nsecond: {key: b}\n", 1000)
+        config = self.make_config()
+        with mock.patch.object(config, "parse_contents") as parse_patch:
+            config.refresh()
+            # A new mtime with the same contents is hashed but not parsed
+            self.write("first: {key: a}\nsecond: {key: b}\n", 2000)
+            config.refresh()
+        assert not parse_patch.called
+        assert config.get_stats()["first"]["unchanged"] == 2
+
+    def test_only_changed_sections_are_reloaded(self):
+        self.write("first: {key: a}\nsecond: {key: b}\n", 1000)
+        config = self.make_config()
+        first = config["first"]
+        self.write("first: {key: a}\nsecond: {key: c}\n", 2000)
+        config.refresh()
+        assert config["first"] == first
+        assert config["second"] == {"key":"c"}
+        stats = config.get_stats()
+        assert stats["first"]["unchanged"] == 1
+        assert stats["second"]["unchanged"] == 0
+
+    def test_expired_section_sees_file_changes(self):
+        self.write("first: {key: a}\nsecond: {key: b}\n", 1000)
+        config = self.make_config(refresh_seconds=None)
+        assert config["first"] == {"key":"a"}
+        self.write("first: {key: changed}\nsecond: {key: b}\n", 2000)
+        config.invalidate_section("first")
+        assert config["first"] == {"key":"changed"}
+        assert config.file_data["first"] == {"key":"changed"}
+
+    def test_change_of_type_is_not_unchanged(self):
+        class Config(SingleFileConfig):
+            schema = {"first":{"key":{"type":"integer"}}, "second":{"key":{"type":"string"}}}
+            serve_stale_on_error = False
+
+        self.write("first: {key: 1}\nsecond: {key: b}\n", 1000)
+        config = Config(search_path=[self.config_dir], config_file="config.yml")
+        self.write("first: {key: 1.0}\nsecond: {key: b}\n", 2000)
+        with self.assertRaises(ValidationError):
+            config.refresh()
+        assert config.file_data["first"] == {"key":1.0}
+        assert isinstance(config.file_data["first"]["key"], float)
+
+        # Cerberus accepts booleans as integers, so this one is published
+        self.write("first: {key: true}\nsecond: {key: b}\n", 3000)
+        config.refresh()
+        assert config["first"]["key"] is True
+
+    def test_refresh_raises_when_last_good_value_is_kept(self):
+        class Config(SingleFileConfig):
+            schema = {"first":{"key":{"type":"integer"}}, "second":{"key":{"type":"string"}}}
+
+        self.write("first: {key: 1}\nsecond: {key: b}\n", 1000)
+        config = Config(search_path=[self.config_dir], config_file="config.yml")
+        self.write("first: {key: a}\nsecond: {key: c}\n", 2000)
+        with self.assertRaises(ValidationError):
+            config.refresh()
+        assert config["first"] == {"key":1}
+        assert config["second"] == {"key":"c"}
+        assert config.is_section_degraded("first")
+        # Changes seen by the watcher keep the last good value quietly
+        config.files_changed(None)
+        assert config["first"] == {"key":1}
+
+    def test_snapshot_path_is_ignored_with_warning(self):
+        self.write("first: {key: a}\nsecond: {key: b}\n", 1000)
+        snapshot_path = os.path.join(self.config_dir, "snapshot.bin")
+        with self.assertLogs("turf.config", level="WARNING") as logs:
+            config = self.make_config(snapshot_path=snapshot_path)
+            config.refresh()
+            config.preload()
+        assert len(logs.output) == 1
+        assert not os.path.exists(snapshot_path)
+
+    def test_unchanged_section_is_not_shared(self):
+        self.write("first: {key: a}\nsecond: {key: b}\n", 1000)
+        config = self.make_config()
+        config["first"]["key"] = "mutated"
+        config.refresh()
+        assert config["first"] == {"key":"a"}
+        assert config.file_data["first"] == {"key":"a"}
+
+    def test_immutable_unchanged_section_is_reused(self):
+        self.write("first: {key: a}\nsecond: {key: b}\n", 1000)
+        config = self.make_config(immutable=True)
+        first = config["first"]
+        config.refresh()
+        assert config["first"] is first
+
+    def test_mergehook_gets_copy_of_parsed_file(self):
+        self.write("first: {key: a}\nsecond: {key: b}\n", 1000)
+
+        def merge(section_name, section_defaults, config_from_file):
+            config_from_file["key"] = "merged"
+            return config_from_file
+
+        config = self.make_config()
+        with mock.patch.object(config, "get_mergehooks", return_value={"first": merge}):
+            config.refresh()
+            assert config["first"] == {"key":"merged"}
+        assert config.file_data["first"] == {"key":"a"}
+
+    def test_hooked_sections_are_not_shared(self):
+        self.write("first: {key: a, nested: {key: a}}\nsecond: {key: b}\n", 1000)
+
+        class Config(SingleFileConfig):
+            schema = {"first":{"key":{"type":"string"}, "nested":{"type":"dict"}},
+                      "second":{"key":{"type":"string"}}}
+
+        def keep(section_name, section):
+            return section
+
+        for hook in ("get_prehooks", "get_posthooks"):
+            config = Config(search_path=[self.config_dir], config_file="config.yml")
+            with mock.patch.object(config, hook, return_value={"first": keep}):
+                config.refresh()
+                config["first"]["nested"]["key"] = "mutated"
+                config.refresh()
+                assert config["first"]["nested"] == {"key":"a"}, hook
+            assert config.file_data["first"]["nested"] == {"key":"a"}, hook
+
+    def test_refresh_holds_section_locks(self):
+        self.write("first: {key: a}\nsecond: {key: b}\n", 1000)
+        config = self.make_config()
+        load_section = config.load_section
+        locked = {}
+
+        def load_and_check_lock(section_name, *args):
+            lock = config.get_section_lock(section_name)
+            acquired = []
+            # Another thread must not be able to reload the section meanwhile
+            checker = threading.Thread(target=lambda: acquired.append(lock.acquire(blocking=False)))
+            checker.start()
+            checker.join()
+            locked[section_name] = not acquired[0]
+            return load_section(section_name, *args)
+
+        self.write("first: {key: c}\nsecond: {key: d}\n", 2000)
+        with mock.patch.object(config, "load_section", side_effect=load_and_check_lock):
+            config.refresh()
+        assert locked == {"first": True, "second": True}
+        assert config["first"] == {"key":"c"}
+        assert config["second"] == {"key":"d"}
+
+
+class TestSearchPathResolution(TestCase):
+
+    def setUp(self):
+        self.first_dir = tempfile.mkdtemp()
+        self.second_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.first_dir)
+        self.addCleanup(shutil.rmtree, self.second_dir)
+        for path in (self.first_dir, self.second_dir):
+            os.utime(path, (1000, 1000))
+
+    def make_config(self):
+        with mock.patch("turf.config.SingleFileConfig.refresh"):
+            return SingleFileConfig(search_path=[self.first_dir, self.second_dir],
+                                    config_file="config.yml")
+
+    def test_resolved_path_is_cached(self):
+        with open(os.path.join(self.second_dir, "config.yml"), "w") as config_file:
+            config_file.write("{}")
+        os.utime(self.second_dir, (1000, 1000))
+        config = self.make_config()
+        config.search_path_check_seconds = 0
+        assert config.get_file_path() == os.path.join(self.second_dir, "config.yml")
+        with mock.patch("os.path.exists") as exists_patch:
+            assert config.get_file_path() == os.path.join(self.second_dir, "config.yml")
+        assert not exists_patch.called
+
+    def test_file_added_earlier_in_search_path(self):
+        with open(os.path.join(self.second_dir, "config.yml"), "w") as config_file:
+            config_file.write("{}")
+        config = self.make_config()
+        assert config.get_file_path() == os.path.join(self.second_dir, "config.yml")
+
+        with open(os.path.join(self.first_dir, "config.yml"), "w") as config_file:
+            config_file.write("{}")
+        # Still cached until the search path is checked again
+        assert config.get_file_path() == os.path.join(self.second_dir, "config.yml")
+        config.search_path_check_seconds = 0
+        assert config.get_file_path() == os.path.join(self.first_dir, "config.yml")
 
-                sfc = Config(search_path=[fake_config_dir],
-                             config_file=fake_file_name)
-                assert sfc.read_section_from_file(fake_section) == fake_config[fake_section]
+    def test_missing_file_is_cached(self):
+        config = self.make_config()
+        config.search_path_check_seconds = 0
+        assert config.get_file_path() is None
+        with mock.patch("os.path.exists") as exists_patch:
+            assert config.get_file_path() is None
+        assert not exists_patch.called
+        assert config.load_file() == {}
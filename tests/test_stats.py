@@ -0,0 +1,37 @@
+import unittest
+
+from turf.config import StageTimer
+from turf.stats import SectionStats, to_prometheus
+
+
+class TestStats(unittest.TestCase):
+
+    def test_record_load(self):
+        timer = StageTimer()
+        timer.timings.update({"read": 1.0, "parse": 0.5, "validate_defaults": 0.25, "validate": 0.25})
+        section_stats = SectionStats()
+        section_stats.record_load(timer)
+        section_stats.record_load(timer, unchanged=True)
+        stats = section_stats.as_dict()
+        self.assertEqual(stats["loads"], 2)
+        self.assertEqual(stats["unchanged"], 1)
+        self.assertEqual(stats["parse_seconds"], 1.0)
+        self.assertEqual(stats["validation_seconds"], 1.0)
+        self.assertGreaterEqual(stats["age_seconds"], 0)
+
+    def test_record_error(self):
+        section_stats = SectionStats()
+        section_stats.record_error(ValueError("bad"))
+        stats = section_stats.as_dict()
+        self.assertEqual(stats["errors"], 1)
+        self.assertEqual(stats["last_error"], "ValueError('bad')")
+        self.assertIsNone(stats["age_seconds"])
+
+    def test_to_prometheus(self):
+        section_stats = SectionStats()
+        section_stats.cache_hits = 3
+        text = to_prometheus({'sec"tion': section_stats.as_dict()}, prefix="app", labels={"config": "main"})
+        self.assertIn("# TYPE app_section_cache_hits_total counter\n", text)
+        self.assertIn('app_section_cache_hits_total{section="sec\\"tion",config="main"} 3\n', text)
+        self.assertIn('app_section_parse_seconds_total{section="sec\\"tion",config="main"} 0.0\n', text)
+        self.assertNotIn("app_section_age_seconds{", text)
@@ -0,0 +1,69 @@
+# flake8: noqa
+import os
+import queue
+import shutil
+import tempfile
+import unittest
+import uuid
+from unittest import TestCase
+
+from turf.config import BaseConfig
+from turf.watch import InotifyWatcher, PollingWatcher, inotify_available
+
+
+class TestWatch(TestCase):
+
+    def setUp(self):
+        self.config_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.config_dir)
+        self.changes = queue.Queue()
+
+    def write(self, name, contents):
+        path = os.path.join(self.config_dir, name)
+        with open(path, "w") as config_file:
+            config_file.write(contents)
+        return path
+
+    def start(self, watcher):
+        watcher.start()
+        self.addCleanup(watcher.stop)
+
+    def test_polling_watcher_reports_changes(self):
+        path = self.write("a.yml", "a: 1")
+        self.start(PollingWatcher([self.config_dir], self.changes.put, poll_seconds=0.05))
+        self.write("a.yml", "a: 22")
+        assert self.changes.get(timeout=2) == {path}
+
+    @unittest.skipUnless(inotify_available(), "inotify is not available")
+    def test_inotify_watcher_coalesces_atomic_rename(self):
+        path = os.path.join(self.config_dir, "a.yml")
+        self.start(InotifyWatcher([self.config_dir], self.changes.put, debounce_seconds=0.2))
+        temp_path = self.write(".a.yml.tmp", "a: 1")
+        os.rename(temp_path, path)
+        self.write("b.yml", "b: 1")
+        changed = self.changes.get(timeout=2)
+        assert path in changed
+        assert os.path.join(self.config_dir, "b.yml") in changed
+        assert self.changes.empty()
+
+    def test_config_watch_invalidates_changed_section(self):
+        section_name = uuid.uuid4().hex
+        self.write("{0}.yml".format(section_name), "key: first")
+
+        class Config(BaseConfig):
+            schema = {section_name:{"key":{"type":"string"}}, "other":{}}
+            watch_poll_seconds = 0.05
+
+            def files_changed(self, paths):
+                super().files_changed(paths)
+                changes.put(paths)
+
+        changes = self.changes
+        config = Config(config_dir=self.config_dir, refresh_seconds=None, watch=True)
+        self.addCleanup(config.stop_watching)
+        assert config[section_name] == {"key":"first"}
+        self.write("{0}.yml".format(section_name), "key: second")
+        self.changes.get(timeout=2)
+        assert section_name not in config.last_refresh_sections
+        assert "other" in config.last_refresh_sections
+        assert config[section_name] == {"key":"second"}
@@ -0,0 +1,33 @@
+import importlib
+from unittest import TestCase, mock
+
+import yaml
+
+from turf import yaml_util
+
+
+class TestYamlUtil(TestCase):
+
+    def test_safe_load_uses_c_loader_when_available(self):
+        if yaml.__with_libyaml__:
+            self.assertIs(yaml_util.SafeLoader, yaml.CSafeLoader)
+            self.assertTrue(yaml_util.HAS_LIBYAML)
+        self.assertEqual(yaml_util.safe_load("a: [1, 2]"), {"a": [1, 2]})
+        self.assertRaises(yaml.YAMLError, yaml_util.safe_load, "a: !!python/name:os.system")
+
+    def test_falls_back_without_libyaml(self):
+        try:
+            with mock.patch.dict(yaml.__dict__):
+                yaml.__dict__.pop("CSafeLoader", None)
+                yaml.__dict__.pop("CLoader", None)
+                importlib.reload(yaml_util)
+                self.assertIs(yaml_util.SafeLoader, yaml.SafeLoader)
+                self.assertIs(yaml_util.Loader, yaml.Loader)
+                self.assertFalse(yaml_util.HAS_LIBYAML)
+                self.assertEqual(yaml_util.load("a: 1"), {"a": 1})
+        finally:
+            importlib.reload(yaml_util)
+
+    def test_unsafe_load(self):
+        self.assertIs(yaml_util.load("a: !!python/name:os.path.join", safe=False)["a"],
+                      importlib.import_module("os.path").join)